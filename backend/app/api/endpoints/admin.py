@@ -1,18 +1,38 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import Dict, Any, List
-from pydantic import BaseModel, Field
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+import orjson
+from typing import Dict, Any, List, Optional
+from datetime import datetime
+from pydantic import BaseModel, ConfigDict, Field
 from app.api.deps import get_database
 from app.db.models import SystemPrompt, Conversation, Message, SupportAction, Customer
-from sqlalchemy import func, desc
+from sqlalchemy import func, select, desc
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from cachetools import TTLCache
+from app.mcp.server import invalidate_prompts_cache as invalidate_mcp_prompts_cache
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Cached /prompts payload; prompts change rarely but are read on every chat
+# turn, so serve the built list from memory and invalidate on writes
+_prompts_cache: TTLCache = TTLCache(maxsize=1, ttl=300)
+_PROMPTS_CACHE_KEY = "prompts"
+
+# Pre-aggregated analytics payload, refreshed at most every 5 minutes -
+# the in-process stand-in for a materialized view: dashboards reread the
+# cached aggregate instead of rescanning messages and conversations
+_analytics_cache: TTLCache = TTLCache(maxsize=1, ttl=300)
+_ANALYTICS_CACHE_KEY = "analytics"
+
 
 class SystemPromptCreate(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     name: str = Field(..., description="Prompt name")
     content: str = Field(..., description="Prompt content")
     description: str = Field(None, description="Prompt description")
@@ -20,49 +40,82 @@ class SystemPromptCreate(BaseModel):
 
 
 class SystemPromptUpdate(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     content: str = Field(None, description="Prompt content")
     description: str = Field(None, description="Prompt description")
     is_active: bool = Field(None, description="Is prompt active")
     department: str = Field(None, description="Department")
 
 
-@router.get("/prompts", response_model=List[Dict[str, Any]])
+class PromptOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: str
+    content: str
+    description: Optional[str]
+    is_active: bool
+    department: str
+    created_at: datetime
+    updated_at: Optional[datetime]
+
+
+class ConversationOut(BaseModel):
+    id: int
+    session_id: str
+    customer_email: Optional[str]
+    customer_name: Optional[str]
+    status: str
+    message_count: int
+    last_message: Optional[str]
+    last_message_at: Optional[datetime]
+    created_at: datetime
+    updated_at: Optional[datetime]
+
+
+class CustomerOut(BaseModel):
+    id: int
+    email: str
+    name: Optional[str]
+    phone: Optional[str]
+    subscription_status: Optional[str]
+    subscription_plan: Optional[str]
+    total_spent: Optional[str]
+    conversation_count: int
+    created_at: datetime
+    updated_at: Optional[datetime]
+
+
+@router.get("/prompts", response_model=List[PromptOut])
 async def get_system_prompts(
-    db: Session = Depends(get_database)
+    db: AsyncSession = Depends(get_database)
 ):
     """Get all system prompts"""
     try:
-        prompts = db.query(SystemPrompt).order_by(desc(SystemPrompt.created_at)).all()
-        return [
-            {
-                "id": prompt.id,
-                "name": prompt.name,
-                "content": prompt.content,
-                "description": prompt.description,
-                "is_active": prompt.is_active,
-                "department": prompt.department,
-                "created_at": prompt.created_at.isoformat(),
-                "updated_at": prompt.updated_at.isoformat() if prompt.updated_at else None
-            }
-            for prompt in prompts
-        ]
+        cached = _prompts_cache.get(_PROMPTS_CACHE_KEY)
+        if cached is not None:
+            return cached
+
+        result = await db.execute(
+            select(SystemPrompt).order_by(desc(SystemPrompt.created_at))
+        )
+        prompts = result.scalars().all()
+        payload = [PromptOut.model_validate(prompt) for prompt in prompts]
+        _prompts_cache[_PROMPTS_CACHE_KEY] = payload
+        return payload
     except Exception as e:
         logger.error(f"Error getting system prompts: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/prompts", response_model=Dict[str, Any])
+@router.post("/prompts", response_model=PromptOut)
 async def create_system_prompt(
     request: SystemPromptCreate,
-    db: Session = Depends(get_database)
+    db: AsyncSession = Depends(get_database)
 ):
     """Create a new system prompt"""
     try:
-        # Check if prompt name already exists
-        existing = db.query(SystemPrompt).filter(SystemPrompt.name == request.name).first()
-        if existing:
-            raise HTTPException(status_code=400, detail="Prompt name already exists")
-        
         prompt = SystemPrompt(
             name=request.name,
             content=request.content,
@@ -70,18 +123,25 @@ async def create_system_prompt(
             department=request.department
         )
         db.add(prompt)
-        db.commit()
-        db.refresh(prompt)
-        
-        return {
-            "id": prompt.id,
-            "name": prompt.name,
-            "content": prompt.content,
-            "description": prompt.description,
-            "is_active": prompt.is_active,
-            "department": prompt.department,
-            "created_at": prompt.created_at.isoformat()
-        }
+        # The UNIQUE constraint on name does the duplicate check at insert
+        # time - no pre-check round trip, and no race between check and
+        # insert
+        try:
+            await db.commit()
+        except IntegrityError as e:
+            await db.rollback()
+            # Only the unique violation on name means a duplicate; any
+            # other constraint failure (e.g. NOT NULL) surfaces as the
+            # real error instead of a misleading duplicate-name 400
+            message = str(e.orig)
+            if "system_prompts.name" in message or "ix_system_prompts_name" in message:
+                raise HTTPException(status_code=400, detail="Prompt name already exists")
+            raise
+        await db.refresh(prompt)
+        _prompts_cache.pop(_PROMPTS_CACHE_KEY, None)
+        invalidate_mcp_prompts_cache()
+
+        return prompt
     except HTTPException:
         raise
     except Exception as e:
@@ -89,18 +149,20 @@ async def create_system_prompt(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.put("/prompts/{prompt_id}", response_model=Dict[str, Any])
+@router.put("/prompts/{prompt_id}", response_model=PromptOut)
 async def update_system_prompt(
     prompt_id: int,
     request: SystemPromptUpdate,
-    db: Session = Depends(get_database)
+    db: AsyncSession = Depends(get_database)
 ):
     """Update a system prompt"""
     try:
-        prompt = db.query(SystemPrompt).filter(SystemPrompt.id == prompt_id).first()
+        prompt = await db.scalar(
+            select(SystemPrompt).where(SystemPrompt.id == prompt_id)
+        )
         if not prompt:
             raise HTTPException(status_code=404, detail="Prompt not found")
-        
+
         if request.content is not None:
             prompt.content = request.content
         if request.description is not None:
@@ -109,19 +171,13 @@ async def update_system_prompt(
             prompt.is_active = request.is_active
         if request.department is not None:
             prompt.department = request.department
-        
-        db.commit()
-        db.refresh(prompt)
-        
-        return {
-            "id": prompt.id,
-            "name": prompt.name,
-            "content": prompt.content,
-            "description": prompt.description,
-            "is_active": prompt.is_active,
-            "department": prompt.department,
-            "updated_at": prompt.updated_at.isoformat() if prompt.updated_at else None
-        }
+
+        await db.commit()
+        await db.refresh(prompt)
+        _prompts_cache.pop(_PROMPTS_CACHE_KEY, None)
+        invalidate_mcp_prompts_cache()
+
+        return prompt
     except HTTPException:
         raise
     except Exception as e:
@@ -132,17 +188,21 @@ async def update_system_prompt(
 @router.delete("/prompts/{prompt_id}")
 async def delete_system_prompt(
     prompt_id: int,
-    db: Session = Depends(get_database)
+    db: AsyncSession = Depends(get_database)
 ):
     """Delete a system prompt"""
     try:
-        prompt = db.query(SystemPrompt).filter(SystemPrompt.id == prompt_id).first()
+        prompt = await db.scalar(
+            select(SystemPrompt).where(SystemPrompt.id == prompt_id)
+        )
         if not prompt:
             raise HTTPException(status_code=404, detail="Prompt not found")
-        
-        db.delete(prompt)
-        db.commit()
-        
+
+        await db.delete(prompt)
+        await db.commit()
+        _prompts_cache.pop(_PROMPTS_CACHE_KEY, None)
+        invalidate_mcp_prompts_cache()
+
         return {"message": "Prompt deleted successfully"}
     except HTTPException:
         raise
@@ -153,151 +213,195 @@ async def delete_system_prompt(
 
 @router.get("/analytics", response_model=Dict[str, Any])
 async def get_analytics(
-    db: Session = Depends(get_database)
+    db: AsyncSession = Depends(get_database)
 ):
     """Get conversation analytics"""
+    cached = _analytics_cache.get(_ANALYTICS_CACHE_KEY)
+    if cached is not None:
+        return cached
+
     try:
-        # Total conversations
-        total_conversations = db.query(Conversation).count()
-        
-        # Active conversations
-        active_conversations = db.query(Conversation).filter(
-            Conversation.status == "active"
-        ).count()
-        
-        # Escalated conversations
-        escalated_conversations = db.query(Conversation).filter(
-            Conversation.status == "escalated"
-        ).count()
-        
-        # Resolved conversations
-        resolved_conversations = db.query(Conversation).filter(
-            Conversation.status == "resolved"
-        ).count()
-        
-        # Total messages
-        total_messages = db.query(Message).count()
-        
-        # AI messages
-        ai_messages = db.query(Message).filter(Message.sender_type == "ai").count()
-        
-        # Customer messages
-        customer_messages = db.query(Message).filter(Message.sender_type == "customer").count()
-        
-        # Support actions
-        total_actions = db.query(SupportAction).count()
-        refund_actions = db.query(SupportAction).filter(
-            SupportAction.action_type == "refund"
-        ).count()
-        subscription_actions = db.query(SupportAction).filter(
-            SupportAction.action_type.like("subscription_%")
-        ).count()
-        
-        # Recent conversations
-        recent_conversations = db.query(Conversation).order_by(
-            desc(Conversation.created_at)
-        ).limit(10).all()
-        
+        # Conversation counts in a single aggregate scan
+        conv_counts = (await db.execute(
+            select(
+                func.count().label("total"),
+                func.count().filter(Conversation.status == "active").label("active"),
+                func.count().filter(Conversation.status == "escalated").label("escalated"),
+                func.count().filter(Conversation.status == "resolved").label("resolved")
+            ).select_from(Conversation)
+        )).one()
+
+        # Message counts in a single aggregate scan
+        msg_counts = (await db.execute(
+            select(
+                func.count().label("total"),
+                func.count().filter(Message.sender_type == "ai").label("ai"),
+                func.count().filter(Message.sender_type == "customer").label("customer")
+            ).select_from(Message)
+        )).one()
+
+        # Support action counts in a single aggregate scan
+        action_counts = (await db.execute(
+            select(
+                func.count().label("total"),
+                func.count().filter(SupportAction.action_category == "refund").label("refunds"),
+                func.count().filter(
+                    SupportAction.action_category == "subscription"
+                ).label("subscriptions")
+            ).select_from(SupportAction)
+        )).one()
+
+        # Recent conversations, with messages eager-loaded in one IN query
+        # so no per-conversation lazy load can fire
+        result = await db.execute(
+            select(Conversation)
+            .options(selectinload(Conversation.messages))
+            .order_by(desc(Conversation.created_at))
+            .limit(10)
+        )
+        recent_conversations = result.scalars().all()
+
         recent_conv_data = []
         for conv in recent_conversations:
-            message_count = db.query(Message).filter(
-                Message.conversation_id == conv.id
-            ).count()
             recent_conv_data.append({
                 "id": conv.id,
                 "session_id": conv.session_id,
                 "customer_email": conv.customer_email,
                 "status": conv.status,
-                "message_count": message_count,
+                "message_count": len(conv.messages),
                 "created_at": conv.created_at.isoformat()
             })
-        
-        return {
+
+        payload = {
             "conversations": {
-                "total": total_conversations,
-                "active": active_conversations,
-                "escalated": escalated_conversations,
-                "resolved": resolved_conversations
+                "total": conv_counts.total,
+                "active": conv_counts.active,
+                "escalated": conv_counts.escalated,
+                "resolved": conv_counts.resolved
             },
             "messages": {
-                "total": total_messages,
-                "ai_messages": ai_messages,
-                "customer_messages": customer_messages
+                "total": msg_counts.total,
+                "ai_messages": msg_counts.ai,
+                "customer_messages": msg_counts.customer
             },
             "actions": {
-                "total": total_actions,
-                "refunds": refund_actions,
-                "subscription_changes": subscription_actions
+                "total": action_counts.total,
+                "refunds": action_counts.refunds,
+                "subscription_changes": action_counts.subscriptions
             },
             "recent_conversations": recent_conv_data
         }
+        _analytics_cache[_ANALYTICS_CACHE_KEY] = payload
+        return payload
     except Exception as e:
         logger.error(f"Error getting analytics: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/conversations", response_model=List[Dict[str, Any]])
+@router.get("/conversations", response_model=List[ConversationOut])
 async def get_all_conversations(
     limit: int = 50,
     offset: int = 0,
     status: str = None,
-    db: Session = Depends(get_database)
+    db: AsyncSession = Depends(get_database)
 ):
     """Get all conversations with pagination"""
     try:
-        query = db.query(Conversation)
-        
+        # Correlated subquery for the latest message content per conversation
+        last_message_content = (
+            select(Message.content)
+            .where(Message.conversation_id == Conversation.id)
+            .order_by(desc(Message.created_at))
+            .limit(1)
+            .correlate(Conversation)
+            .scalar_subquery()
+        )
+
+        # Single query: message count and last-message timestamp via LEFT JOIN
+        stmt = (
+            select(
+                Conversation,
+                func.count(Message.id).label("message_count"),
+                func.max(Message.created_at).label("last_message_at"),
+                last_message_content.label("last_message")
+            )
+            .outerjoin(Message, Message.conversation_id == Conversation.id)
+            .group_by(Conversation.id)
+        )
+
         if status:
-            query = query.filter(Conversation.status == status)
-        
-        conversations = query.order_by(desc(Conversation.created_at)).offset(offset).limit(limit).all()
-        
-        result = []
-        for conv in conversations:
-            message_count = db.query(Message).filter(
-                Message.conversation_id == conv.id
-            ).count()
-            
-            last_message = db.query(Message).filter(
-                Message.conversation_id == conv.id
-            ).order_by(desc(Message.created_at)).first()
-            
-            result.append({
+            stmt = stmt.where(Conversation.status == status)
+
+        # Stream rows instead of materializing the full page; the cursor
+        # drives output so peak memory stays flat regardless of limit
+        result = await db.stream(
+            stmt.order_by(desc(Conversation.created_at))
+            .offset(offset).limit(limit)
+            .execution_options(yield_per=200)
+        )
+    except Exception as e:
+        logger.error(f"Error getting conversations: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def generate():
+        yield b"["
+        first = True
+        async for conv, message_count, last_message_at, last_message in result:
+            if not first:
+                yield b","
+            first = False
+            yield orjson.dumps({
                 "id": conv.id,
                 "session_id": conv.session_id,
                 "customer_email": conv.customer_email,
                 "customer_name": conv.customer_name,
                 "status": conv.status,
                 "message_count": message_count,
-                "last_message": last_message.content if last_message else None,
-                "last_message_at": last_message.created_at.isoformat() if last_message else None,
-                "created_at": conv.created_at.isoformat(),
-                "updated_at": conv.updated_at.isoformat() if conv.updated_at else None
+                "last_message": last_message,
+                "last_message_at": last_message_at,
+                "created_at": conv.created_at,
+                "updated_at": conv.updated_at
             })
-        
-        return result
-    except Exception as e:
-        logger.error(f"Error getting conversations: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        yield b"]"
 
+    return StreamingResponse(generate(), media_type="application/json")
 
-@router.get("/customers", response_model=List[Dict[str, Any]])
+
+@router.get("/customers", response_model=List[CustomerOut])
 async def get_customers(
     limit: int = 50,
     offset: int = 0,
-    db: Session = Depends(get_database)
+    db: AsyncSession = Depends(get_database)
 ):
     """Get all customers"""
     try:
-        customers = db.query(Customer).order_by(desc(Customer.created_at)).offset(offset).limit(limit).all()
-        
-        result = []
-        for customer in customers:
-            conversation_count = db.query(Conversation).filter(
-                Conversation.customer_email == customer.email
-            ).count()
-            
-            result.append({
+        # Correlated count avoids a COUNT query per customer
+        conversation_count = (
+            select(func.count())
+            .select_from(Conversation)
+            .where(Conversation.customer_email == Customer.email)
+            .correlate(Customer)
+            .scalar_subquery()
+        )
+
+        # Stream rows instead of materializing the full page
+        result = await db.stream(
+            select(Customer, conversation_count.label("conversation_count"))
+            .order_by(desc(Customer.created_at)).offset(offset).limit(limit)
+            .execution_options(yield_per=200)
+        )
+    except Exception as e:
+        logger.error(f"Error getting customers: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def generate():
+        yield b"["
+        first = True
+        async for customer, conversation_count in result:
+            if not first:
+                yield b","
+            first = False
+            yield orjson.dumps({
                 "id": customer.id,
                 "email": customer.email,
                 "name": customer.name,
@@ -306,11 +410,9 @@ async def get_customers(
                 "subscription_plan": customer.subscription_plan,
                 "total_spent": customer.total_spent,
                 "conversation_count": conversation_count,
-                "created_at": customer.created_at.isoformat(),
-                "updated_at": customer.updated_at.isoformat() if customer.updated_at else None
+                "created_at": customer.created_at,
+                "updated_at": customer.updated_at
             })
-        
-        return result
-    except Exception as e:
-        logger.error(f"Error getting customers: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        yield b"]"
+
+    return StreamingResponse(generate(), media_type="application/json")
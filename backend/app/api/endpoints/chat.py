@@ -1,28 +1,46 @@
 from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Dict, Any, List
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from app.api.deps import get_database
+from app.core.config import settings
+from app.db import AsyncSessionLocal
 from app.services import ChatService
-import json
+import asyncio
 import logging
+import orjson
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
+class WSIncomingFrame(BaseModel):
+    """Incoming WebSocket frame, parsed in one pass by pydantic-core"""
+    model_config = ConfigDict(extra="ignore")
+
+    type: str
+    content: str = ""
+    reason: str = "Customer request"
+
+
 class StartChatRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     customer_email: str = Field(..., description="Customer email address")
     customer_name: str = Field(None, description="Customer name (optional)")
 
 
 class SendMessageRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     session_id: str = Field(..., description="Chat session ID")
     content: str = Field(..., description="Message content")
 
 
 class EscalateRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     session_id: str = Field(..., description="Chat session ID")
     reason: str = Field(..., description="Reason for escalation")
 
@@ -30,7 +48,7 @@ class EscalateRequest(BaseModel):
 @router.post("/start", response_model=Dict[str, str])
 async def start_chat(
     request: StartChatRequest,
-    db: Session = Depends(get_database)
+    db: AsyncSession = Depends(get_database)
 ):
     """Start a new chat conversation"""
     try:
@@ -48,7 +66,7 @@ async def start_chat(
 @router.post("/message", response_model=Dict[str, Any])
 async def send_message(
     request: SendMessageRequest,
-    db: Session = Depends(get_database)
+    db: AsyncSession = Depends(get_database)
 ):
     """Send a message in a chat conversation"""
     try:
@@ -68,12 +86,12 @@ async def send_message(
 @router.get("/history/{session_id}", response_model=List[Dict[str, Any]])
 async def get_chat_history(
     session_id: str,
-    db: Session = Depends(get_database)
+    db: AsyncSession = Depends(get_database)
 ):
     """Get chat conversation history"""
     try:
         chat_service = ChatService(db)
-        history = chat_service.get_conversation_history(session_id)
+        history = await chat_service.get_conversation_history(session_id)
         return history
     except Exception as e:
         logger.error(f"Error getting chat history: {str(e)}")
@@ -83,12 +101,12 @@ async def get_chat_history(
 @router.post("/escalate", response_model=Dict[str, Any])
 async def escalate_chat(
     request: EscalateRequest,
-    db: Session = Depends(get_database)
+    db: AsyncSession = Depends(get_database)
 ):
     """Escalate chat to human agent"""
     try:
         chat_service = ChatService(db)
-        response = chat_service.escalate_conversation(
+        response = await chat_service.escalate_conversation(
             session_id=request.session_id,
             reason=request.reason
         )
@@ -103,12 +121,12 @@ async def escalate_chat(
 @router.get("/summary/{session_id}", response_model=Dict[str, Any])
 async def get_chat_summary(
     session_id: str,
-    db: Session = Depends(get_database)
+    db: AsyncSession = Depends(get_database)
 ):
     """Get chat conversation summary"""
     try:
         chat_service = ChatService(db)
-        summary = chat_service.get_conversation_summary(session_id)
+        summary = await chat_service.get_conversation_summary(session_id)
         return summary
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -119,19 +137,61 @@ async def get_chat_summary(
 
 # WebSocket connection manager
 class ConnectionManager:
+    """Tracks WebSocket connections per session.
+
+    With a single worker, messages are delivered straight to the local
+    socket. When REDIS_URL is configured, messages are published to a
+    per-session Redis channel instead, so a session connected to another
+    worker still receives them.
+    """
+
     def __init__(self):
         self.active_connections: Dict[str, WebSocket] = {}
+        self._redis = None
+        self._relay_tasks: Dict[str, asyncio.Task] = {}
+
+    def _get_redis(self):
+        if self._redis is None and settings.REDIS_URL:
+            import redis.asyncio as aioredis
+            self._redis = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+        return self._redis
 
     async def connect(self, websocket: WebSocket, session_id: str):
         await websocket.accept()
         self.active_connections[session_id] = websocket
+        if self._get_redis() is not None:
+            self._relay_tasks[session_id] = asyncio.create_task(
+                self._relay_channel(session_id)
+            )
+
+    async def _relay_channel(self, session_id: str):
+        """Forward messages published for this session to the local socket"""
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(f"chat:{session_id}")
+        try:
+            async for item in pubsub.listen():
+                if item["type"] != "message":
+                    continue
+                websocket = self.active_connections.get(session_id)
+                if websocket:
+                    await websocket.send_text(item["data"])
+        except asyncio.CancelledError:
+            pass
+        finally:
+            await pubsub.unsubscribe(f"chat:{session_id}")
+            await pubsub.close()
 
     def disconnect(self, session_id: str):
-        if session_id in self.active_connections:
-            del self.active_connections[session_id]
+        self.active_connections.pop(session_id, None)
+        relay = self._relay_tasks.pop(session_id, None)
+        if relay is not None:
+            relay.cancel()
 
     async def send_personal_message(self, message: str, session_id: str):
-        if session_id in self.active_connections:
+        redis = self._get_redis()
+        if redis is not None:
+            await redis.publish(f"chat:{session_id}", message)
+        elif session_id in self.active_connections:
             await self.active_connections[session_id].send_text(message)
 
 
@@ -142,49 +202,70 @@ manager = ConnectionManager()
 async def websocket_endpoint(websocket: WebSocket, session_id: str):
     """WebSocket endpoint for real-time chat"""
     await manager.connect(websocket, session_id)
-    
-    # Get database session
-    db = next(get_database())
-    chat_service = ChatService(db)
-    
-    try:
-        while True:
-            # Receive message from client
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
-            
-            if message_data.get("type") == "message":
-                # Process the message
-                response = await chat_service.send_message(
-                    session_id=session_id,
-                    content=message_data.get("content", "")
-                )
-                
-                # Send response back to client
-                await websocket.send_text(json.dumps({
-                    "type": "response",
-                    "data": response
-                }))
-            
-            elif message_data.get("type") == "escalate":
-                # Handle escalation
-                response = chat_service.escalate_conversation(
+
+    # AI replies run as background tasks so the socket keeps receiving
+    # while the model call is in flight; one slow request no longer blocks
+    # the read loop
+    pending_tasks: set = set()
+
+    async def process_message(content: str):
+        # Each task gets its own session; AsyncSession is not safe to
+        # share across concurrent tasks
+        try:
+            async with AsyncSessionLocal() as task_db:
+                response = await ChatService(task_db).send_message(
                     session_id=session_id,
-                    reason=message_data.get("reason", "Customer request")
+                    content=content
                 )
-                
-                await websocket.send_text(json.dumps({
-                    "type": "escalated",
-                    "data": response
-                }))
-    
-    except WebSocketDisconnect:
-        manager.disconnect(session_id)
-    except Exception as e:
-        logger.error(f"WebSocket error: {str(e)}")
-        await websocket.send_text(json.dumps({
-            "type": "error",
-            "message": str(e)
-        }))
-    finally:
-        db.close()
\ No newline at end of file
+            await websocket.send_text(orjson.dumps({
+                "type": "response",
+                "data": response
+            }).decode())
+        except Exception as e:
+            logger.error(f"WebSocket message error: {str(e)}")
+            await websocket.send_text(orjson.dumps({
+                "type": "error",
+                "message": str(e)
+            }).decode())
+
+    # Get database session
+    async with AsyncSessionLocal() as db:
+        chat_service = ChatService(db)
+
+        try:
+            while True:
+                # Receive message from client
+                data = await websocket.receive_text()
+                frame = WSIncomingFrame.model_validate_json(data)
+
+                if frame.type == "message":
+                    # Process the message without blocking the read loop
+                    task = asyncio.create_task(process_message(frame.content))
+                    pending_tasks.add(task)
+                    task.add_done_callback(pending_tasks.discard)
+
+                elif frame.type == "escalate":
+                    # Handle escalation
+                    response = await chat_service.escalate_conversation(
+                        session_id=session_id,
+                        reason=frame.reason
+                    )
+
+                    await websocket.send_text(orjson.dumps({
+                        "type": "escalated",
+                        "data": response
+                    }).decode())
+
+        except WebSocketDisconnect:
+            manager.disconnect(session_id)
+        except Exception as e:
+            logger.error(f"WebSocket error: {str(e)}")
+            await websocket.send_text(orjson.dumps({
+                "type": "error",
+                "message": str(e)
+            }).decode())
+        finally:
+            for task in pending_tasks:
+                task.cancel()
+            if pending_tasks:
+                await asyncio.gather(*pending_tasks, return_exceptions=True)
@@ -1,20 +1,31 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select, func, insert, literal, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import raiseload
 from typing import List, Optional
-from app.api.deps import get_database, get_current_user, get_current_organization
-from app.db.models import Organization, User, APIKey, UserRole
+from app.api.deps import (
+    get_database, get_current_user, get_current_organization, hash_api_key_secret
+)
+from app.db.models import Organization, User, APIKey, APIKeyScope, UserRole
 from app.schemas.organization import (
+    USER_LIST_ADAPTER, API_KEY_LIST_ADAPTER,
     OrganizationCreate, OrganizationUpdate, OrganizationResponse,
     UserCreate, UserUpdate, UserResponse,
     APIKeyCreate, APIKeyResponse, APIKeyCreateResponse,
     OrganizationStats
 )
-import hashlib
+import base64
 import secrets
 from datetime import datetime
+from cachetools import TTLCache
 
 router = APIRouter()
 
+# Per-org stats payloads; the dashboard tolerates ~minute-stale counters,
+# so repeat hits within the TTL skip the aggregation entirely
+_org_stats_cache: TTLCache = TTLCache(maxsize=1024, ttl=60)
+
 
 @router.get("/", response_model=OrganizationResponse)
 async def get_current_organization(
@@ -27,7 +38,7 @@ async def get_current_organization(
 @router.put("/", response_model=OrganizationResponse)
 async def update_organization(
     org_update: OrganizationUpdate,
-    db: Session = Depends(get_database),
+    db: AsyncSession = Depends(get_database),
     current_user: User = Depends(get_current_user),
     current_org: Organization = Depends(get_current_organization)
 ):
@@ -37,67 +48,83 @@ async def update_organization(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Insufficient permissions to update organization"
         )
-    
-    # Update organization fields
-    update_data = org_update.dict(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(current_org, field, value)
-    
-    current_org.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(current_org)
-    
-    return current_org
+
+    # Push the diff as one UPDATE ... RETURNING instead of per-field
+    # setattr on the instrumented instance plus a refresh SELECT
+    result = await db.execute(
+        update(Organization)
+        .where(Organization.id == current_org.id)
+        .values(
+            **org_update.model_dump(exclude_unset=True),
+            updated_at=datetime.utcnow()
+        )
+        .returning(Organization)
+        .execution_options(synchronize_session=False, populate_existing=True)
+    )
+    updated_org = result.scalar_one()
+    await db.commit()
+
+    return updated_org
 
 
 @router.get("/stats", response_model=OrganizationStats)
 async def get_organization_stats(
     current_org: Organization = Depends(get_current_organization),
-    db: Session = Depends(get_database)
+    db: AsyncSession = Depends(get_database)
 ):
     """Get organization usage statistics"""
+    cached = _org_stats_cache.get(current_org.id)
+    if cached is not None:
+        return cached
+
     # This would typically involve complex queries
     # For now, return basic stats
-    from app.db.models import Conversation, Message, APIUsageLog, KnowledgeBase, Document
-    
-    # Count active users
-    active_users = db.query(User).filter(
-        User.organization_id == current_org.id,
-        User.is_active == True
-    ).count()
-    
-    # Count active API keys
-    active_api_keys = db.query(APIKey).filter(
-        APIKey.organization_id == current_org.id,
-        APIKey.is_active == True
-    ).count()
-    
-    # Count knowledge bases and documents
-    knowledge_bases_count = db.query(KnowledgeBase).filter(
-        KnowledgeBase.organization_id == current_org.id
-    ).count()
-    
-    total_documents = db.query(Document).filter(
-        Document.organization_id == current_org.id
-    ).count()
-    
-    # Basic usage stats (would be more complex in production)
-    total_conversations = db.query(Conversation).filter(
-        Conversation.organization_id == current_org.id
-    ).count()
-    
-    total_messages = db.query(Message).filter(
-        Message.organization_id == current_org.id
-    ).count()
-    
-    return OrganizationStats(
-        organization=current_org,
+    from app.db.models import (
+        Conversation, Message, APIUsageLog, KnowledgeBase, Document,
+        OrgMonthlyUsage, current_year_month
+    )
+
+    def org_count(model, *extra):
+        return (
+            select(func.count())
+            .select_from(model)
+            .where(model.organization_id == current_org.id, *extra)
+            .scalar_subquery()
+        )
+
+    # All six counters come back in one round trip instead of six
+    (
+        active_users,
+        active_api_keys,
+        knowledge_bases_count,
+        total_documents,
+        total_conversations,
+        total_messages
+    ) = (await db.execute(
+        select(
+            org_count(User, User.is_active == True),
+            org_count(APIKey, APIKey.is_active == True),
+            org_count(KnowledgeBase),
+            org_count(Document),
+            org_count(Conversation),
+            org_count(Message)
+        )
+    )).one()
+
+    # Current-month usage comes from the maintained roll-up: one PK read
+    # instead of aggregating raw api_usage_logs
+    monthly = await db.get(
+        OrgMonthlyUsage, (current_org.id, current_year_month())
+    )
+
+    stats = OrganizationStats(
+        organization=OrganizationResponse.model_validate(current_org),
         usage_current_month={
-            "total_conversations": total_conversations,
+            "total_conversations": monthly.conversation_count if monthly else 0,
             "total_messages": total_messages,
-            "total_api_calls": 0,
-            "total_tokens_used": 0,
-            "total_cost_cents": 0
+            "total_api_calls": monthly.api_calls if monthly else 0,
+            "total_tokens_used": monthly.tokens_used if monthly else 0,
+            "total_cost_cents": monthly.cost_cents if monthly else 0
         },
         usage_total={
             "total_conversations": total_conversations,
@@ -111,16 +138,18 @@ async def get_organization_stats(
         knowledge_bases_count=knowledge_bases_count,
         total_documents=total_documents
     )
+    _org_stats_cache[current_org.id] = stats
+    return stats
 
 
 # User management endpoints
-@router.get("/users", response_model=List[UserResponse])
+@router.get("/users", response_model=None)
 async def list_organization_users(
-    skip: int = 0,
     limit: int = 100,
+    after_id: Optional[int] = None,
     current_user: User = Depends(get_current_user),
     current_org: Organization = Depends(get_current_organization),
-    db: Session = Depends(get_database)
+    db: AsyncSession = Depends(get_database)
 ):
     """List all users in the organization"""
     if current_user.role not in [UserRole.OWNER, UserRole.ADMIN]:
@@ -128,12 +157,29 @@ async def list_organization_users(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Insufficient permissions to list users"
         )
-    
-    users = db.query(User).filter(
+
+    # UserResponse serializes columns only; raiseload turns any future
+    # accidental relationship access during serialization into a loud
+    # error instead of a silent N+1. Pagination is keyset on id alone -
+    # pass the last row's id back as the cursor - so deep pages stay
+    # O(log N); ids are monotonic with creation, and an integer cursor
+    # compares identically on every dialect (SQLite's second-precision
+    # timestamps broke a (created_at, id) tuple cursor)
+    stmt = select(User).where(
         User.organization_id == current_org.id
-    ).offset(skip).limit(limit).all()
-    
-    return users
+    ).options(raiseload("*"))
+    if after_id is not None:
+        stmt = stmt.where(User.id < after_id)
+    result = await db.execute(
+        stmt.order_by(User.id.desc()).limit(limit)
+    )
+    users = result.scalars().all()
+
+    # Validate and dump the whole page through the shared adapter; with
+    # response_model=None FastAPI serializes the dicts as-is
+    return USER_LIST_ADAPTER.dump_python(
+        USER_LIST_ADAPTER.validate_python(users), mode="json"
+    )
 
 
 @router.post("/users", response_model=UserResponse)
@@ -141,7 +187,7 @@ async def create_user(
     user_create: UserCreate,
     current_user: User = Depends(get_current_user),
     current_org: Organization = Depends(get_current_organization),
-    db: Session = Depends(get_database)
+    db: AsyncSession = Depends(get_database)
 ):
     """Create a new user in the organization"""
     if current_user.role not in [UserRole.OWNER, UserRole.ADMIN]:
@@ -149,49 +195,125 @@ async def create_user(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Insufficient permissions to create users"
         )
-    
-    # Check if user already exists
-    existing_user = db.query(User).filter(
-        User.clerk_user_id == user_create.clerk_user_id
-    ).first()
-    if existing_user:
+
+    # One atomic INSERT ... SELECT ... WHERE count < limit: the row is only
+    # inserted while the org is under its user limit, so the former
+    # COUNT-then-INSERT race is gone along with its extra round trips.
+    # Read the limit up front - rollback expires current_org, and a lazy
+    # refresh during the error path would blow up in the AsyncSession
+    max_users = current_org.max_users
+    values = {
+        **user_create.model_dump(),
+        "organization_id": current_org.id,
+        # Python-side column defaults don't apply to INSERT..SELECT
+        "is_active": True
+    }
+    stmt = (
+        insert(User)
+        .from_select(
+            list(values),
+            select(*[
+                literal(value, type_=User.__table__.c[name].type)
+                for name, value in values.items()
+            ]).where(
+                select(func.count()).select_from(User).where(
+                    User.organization_id == current_org.id,
+                    User.is_active == True
+                ).scalar_subquery() < max_users
+            )
+        )
+        .returning(User)
+    )
+
+    # RETURNING hands back the full row - server defaults included - so
+    # no refresh/SELECT follows the commit (expire_on_commit=False)
+    try:
+        new_user = (await db.execute(stmt)).scalar_one_or_none()
+    except IntegrityError:
+        # clerk_user_id uniqueness is enforced by its unique index
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User with this Clerk ID already exists"
         )
-    
-    # Check organization user limit
-    current_user_count = db.query(User).filter(
-        User.organization_id == current_org.id,
-        User.is_active == True
-    ).count()
-    
-    if current_user_count >= current_org.max_users:
+
+    if new_user is None:
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Organization has reached the maximum number of users ({current_org.max_users})"
+            detail=f"Organization has reached the maximum number of users ({max_users})"
         )
-    
-    # Create new user
-    new_user = User(
-        **user_create.dict(),
-        organization_id=current_org.id
-    )
-    
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    
+
+    await db.commit()
     return new_user
 
 
+@router.post("/users/bulk", response_model=List[UserResponse])
+async def bulk_create_users(
+    users_create: List[UserCreate],
+    current_user: User = Depends(get_current_user),
+    current_org: Organization = Depends(get_current_organization),
+    db: AsyncSession = Depends(get_database)
+):
+    """Bulk-import users into the organization"""
+    if current_user.role not in [UserRole.OWNER, UserRole.ADMIN]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Insufficient permissions to create users"
+        )
+
+    if not users_create:
+        return []
+
+    current_user_count = await db.scalar(
+        select(func.count()).select_from(User).where(
+            User.organization_id == current_org.id,
+            User.is_active == True
+        )
+    )
+    if current_user_count + len(users_create) > current_org.max_users:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Import would exceed the maximum number of users ({current_org.max_users})"
+        )
+
+    rows = [
+        {
+            **user_create.model_dump(),
+            "organization_id": current_org.id,
+            "is_active": True
+        }
+        for user_create in users_create
+    ]
+
+    # One executemany INSERT ... RETURNING per batch of 1000 and a single
+    # commit - orders of magnitude fewer round trips than add()+commit()
+    # per row
+    created: List[User] = []
+    try:
+        for start in range(0, len(rows), 1000):
+            result = await db.execute(
+                insert(User).values(rows[start:start + 1000]).returning(User)
+            )
+            created.extend(result.scalars().all())
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="One or more users already exist"
+        )
+
+    return created
+
+
 @router.put("/users/{user_id}", response_model=UserResponse)
 async def update_user(
     user_id: int,
     user_update: UserUpdate,
     current_user: User = Depends(get_current_user),
     current_org: Organization = Depends(get_current_organization),
-    db: Session = Depends(get_database)
+    db: AsyncSession = Depends(get_database)
 ):
     """Update a user in the organization"""
     if current_user.role not in [UserRole.OWNER, UserRole.ADMIN]:
@@ -199,39 +321,44 @@ async def update_user(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Insufficient permissions to update users"
         )
-    
-    # Get user
-    user = db.query(User).filter(
-        User.id == user_id,
-        User.organization_id == current_org.id
-    ).first()
-    
+
+    # Single UPDATE ... RETURNING: no SELECT-then-UPDATE round trip, and
+    # the org filter keeps the write tenant-scoped
+    result = await db.execute(
+        update(User)
+        .where(
+            User.id == user_id,
+            User.organization_id == current_org.id
+        )
+        .values(
+            **user_update.model_dump(exclude_unset=True),
+            updated_at=datetime.utcnow()
+        )
+        .returning(User)
+        .execution_options(synchronize_session=False, populate_existing=True)
+    )
+    user = result.scalar_one_or_none()
+
     if not user:
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
-    
-    # Update user fields
-    update_data = user_update.dict(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(user, field, value)
-    
-    user.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(user)
-    
+
+    await db.commit()
+
     return user
 
 
 # API Key management endpoints
-@router.get("/api-keys", response_model=List[APIKeyResponse])
+@router.get("/api-keys", response_model=None)
 async def list_api_keys(
-    skip: int = 0,
     limit: int = 100,
+    after_id: Optional[int] = None,
     current_user: User = Depends(get_current_user),
     current_org: Organization = Depends(get_current_organization),
-    db: Session = Depends(get_database)
+    db: AsyncSession = Depends(get_database)
 ):
     """List all API keys for the organization"""
     if current_user.role not in [UserRole.OWNER, UserRole.ADMIN]:
@@ -239,20 +366,29 @@ async def list_api_keys(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Insufficient permissions to list API keys"
         )
-    
-    api_keys = db.query(APIKey).filter(
+
+    # Keyset pagination, same contract as /users
+    stmt = select(APIKey).where(
         APIKey.organization_id == current_org.id
-    ).offset(skip).limit(limit).all()
-    
-    return api_keys
+    ).options(raiseload("*"))
+    if after_id is not None:
+        stmt = stmt.where(APIKey.id < after_id)
+    result = await db.execute(
+        stmt.order_by(APIKey.id.desc()).limit(limit)
+    )
+    api_keys = result.scalars().all()
 
+    return API_KEY_LIST_ADAPTER.dump_python(
+        API_KEY_LIST_ADAPTER.validate_python(api_keys), mode="json"
+    )
 
-@router.post("/api-keys", response_model=APIKeyCreateResponse)
+
+@router.post("/api-keys", response_model=None)
 async def create_api_key(
     api_key_create: APIKeyCreate,
     current_user: User = Depends(get_current_user),
     current_org: Organization = Depends(get_current_organization),
-    db: Session = Depends(get_database)
+    db: AsyncSession = Depends(get_database)
 ):
     """Create a new API key"""
     if current_user.role not in [UserRole.OWNER, UserRole.ADMIN]:
@@ -260,44 +396,71 @@ async def create_api_key(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Insufficient permissions to create API keys"
         )
-    
-    # Check API key limit
-    current_key_count = db.query(APIKey).filter(
-        APIKey.organization_id == current_org.id,
-        APIKey.is_active == True
-    ).count()
-    
-    if current_key_count >= current_org.max_api_keys:
+
+    # Generate API key: public key_id for the indexed lookup plus a
+    # secret, encoded base64url straight from the raw bytes
+    key_id = secrets.token_hex(8)
+    secret = base64.urlsafe_b64encode(secrets.token_bytes(32)).rstrip(b"=").decode("ascii")
+    api_key = f"sk_{key_id}.{secret}"
+    key_hash = hash_api_key_secret(secret)
+    key_prefix = api_key[:12]
+
+    # Atomic conditional INSERT, same pattern as create_user: the key is
+    # only created while the org is under its key limit. The limit is
+    # read before any rollback can expire current_org
+    max_api_keys = current_org.max_api_keys
+    values = {
+        **api_key_create.model_dump(),
+        "organization_id": current_org.id,
+        "created_by_user_id": current_user.id,
+        "key_id": key_id,
+        "key_hash": key_hash,
+        "key_prefix": key_prefix,
+        "is_active": True
+    }
+    stmt = (
+        insert(APIKey)
+        .from_select(
+            list(values),
+            select(*[
+                literal(value, type_=APIKey.__table__.c[name].type)
+                for name, value in values.items()
+            ]).where(
+                select(func.count()).select_from(APIKey).where(
+                    APIKey.organization_id == current_org.id,
+                    APIKey.is_active == True
+                ).scalar_subquery() < max_api_keys
+            )
+        )
+        .returning(APIKey)
+    )
+
+    new_api_key = (await db.execute(stmt)).scalar_one_or_none()
+
+    if new_api_key is None:
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Organization has reached the maximum number of API keys ({current_org.max_api_keys})"
+            detail=f"Organization has reached the maximum number of API keys ({max_api_keys})"
         )
-    
-    # Generate API key
-    api_key = f"sk_{current_org.slug}_{secrets.token_urlsafe(32)}"
-    key_hash = hashlib.sha256(api_key.encode()).hexdigest()
-    key_prefix = api_key[:12]
-    
-    # Create API key record
-    new_api_key = APIKey(
-        **api_key_create.dict(),
-        organization_id=current_org.id,
-        created_by_user_id=current_user.id,
-        key_hash=key_hash,
-        key_prefix=key_prefix
-    )
-    
-    db.add(new_api_key)
-    db.commit()
-    db.refresh(new_api_key)
-    
-    # Return response with full API key
-    response = APIKeyCreateResponse(
-        **new_api_key.__dict__,
-        api_key=api_key
-    )
-    
-    return response
+
+    await db.commit()
+
+    # Every field came straight from RETURNING (plus the plaintext key as
+    # a transient attribute - never persisted), so model_construct skips
+    # validation of data the server just wrote, and response_model=None
+    # keeps FastAPI from re-validating the dump
+    new_api_key.api_key = api_key
+    fields = {
+        name: getattr(new_api_key, name)
+        for name in APIKeyCreateResponse.model_fields
+    }
+    # The JSON column hands back plain strings; coerce them so the
+    # unvalidated dump matches the declared List[APIKeyScope] without a
+    # per-request serialization warning
+    fields["scopes"] = [APIKeyScope(scope) for scope in fields["scopes"]]
+    payload = APIKeyCreateResponse.model_construct(**fields)
+    return payload.model_dump(mode="json")
 
 
 @router.delete("/api-keys/{api_key_id}")
@@ -305,7 +468,7 @@ async def delete_api_key(
     api_key_id: int,
     current_user: User = Depends(get_current_user),
     current_org: Organization = Depends(get_current_organization),
-    db: Session = Depends(get_database)
+    db: AsyncSession = Depends(get_database)
 ):
     """Delete an API key"""
     if current_user.role not in [UserRole.OWNER, UserRole.ADMIN]:
@@ -313,23 +476,25 @@ async def delete_api_key(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Insufficient permissions to delete API keys"
         )
-    
+
     # Get API key
-    api_key = db.query(APIKey).filter(
-        APIKey.id == api_key_id,
-        APIKey.organization_id == current_org.id
-    ).first()
-    
+    api_key = await db.scalar(
+        select(APIKey).where(
+            APIKey.id == api_key_id,
+            APIKey.organization_id == current_org.id
+        )
+    )
+
     if not api_key:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="API key not found"
         )
-    
+
     # Soft delete by deactivating
     api_key.is_active = False
     api_key.updated_at = datetime.utcnow()
-    
-    db.commit()
-    
-    return {"message": "API key deactivated successfully"}
\ No newline at end of file
+
+    await db.commit()
+
+    return {"message": "API key deactivated successfully"}
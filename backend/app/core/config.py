@@ -1,46 +1,61 @@
-from typing import List, Union
-from pydantic_settings import BaseSettings
+from functools import lru_cache
+from typing import List, Optional, Union
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import field_validator
-import os
 
 
 class Settings(BaseSettings):
+    # Frozen enables pydantic-core's fast immutable path and lets the
+    # instance be hashed/cached safely
+    model_config = SettingsConfigDict(env_file=".env", case_sensitive=True, frozen=True)
+
     # API Settings
     API_V1_STR: str = "/api/v1"
     PROJECT_NAME: str = "Customer Support AI"
-    
+
     # Security
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
-    
+
     # Database
     DATABASE_URL: str
-    
+    # Dev convenience: create missing tables at startup. Production
+    # deployments run migrations instead and set this to False.
+    AUTO_CREATE_TABLES: bool = True
+
+    # Optional Redis (WebSocket fan-out across workers)
+    REDIS_URL: Optional[str] = None
+
     # External APIs
     GEMINI_API_KEY: str
-    
+
     # Clerk Authentication
     CLERK_SECRET_KEY: str
     CLERK_PUBLISHABLE_KEY: str
     CLERK_JWKS_URL: str
-    
+
     # CORS - Use Union to allow string or list
     CORS_ORIGINS: Union[str, List[str]] = "http://localhost:3000,http://localhost:3001"
-    
+
     @field_validator("CORS_ORIGINS")
     @classmethod
     def assemble_cors_origins(cls, v):
+        # Normalized once here so the CORS middleware's Origin check
+        # scans a minimal, deduplicated list on every preflight
         if isinstance(v, str):
             # Handle comma-separated format
-            return [i.strip() for i in v.split(",")]
-        elif isinstance(v, list):
-            return v
+            v = [i.strip() for i in v.split(",")]
+        if isinstance(v, list):
+            return list(dict.fromkeys(origin for origin in v if origin))
         raise ValueError(f"Invalid CORS_ORIGINS format: {v}")
-    
-    class Config:
-        env_file = ".env"
-        case_sensitive = True
 
 
-settings = Settings()
\ No newline at end of file
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Build Settings once per process; tests can call cache_clear() after
+    patching the environment to get a fresh instance"""
+    return Settings()
+
+
+settings = get_settings()
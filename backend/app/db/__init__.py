@@ -1,12 +1,29 @@
-from .base import Base, engine, SessionLocal
+from sqlalchemy import text
+
+from .base import Base, engine, async_engine, SessionLocal, AsyncSessionLocal
 from .models import *
 
-# Create all tables
-Base.metadata.create_all(bind=engine)
+
+async def init_db():
+    """Create all tables. Called explicitly at startup, not at import time,
+    so importing app.db stays cheap and workers skip the DDL introspection
+    round trips unless schema creation is actually wanted."""
+    async with async_engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # The embedding column and its HNSW index need pgvector;
+            # the extension must exist before create_all sees the DDL
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        await conn.run_sync(Base.metadata.create_all)
+
 
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
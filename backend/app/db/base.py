@@ -1,12 +1,70 @@
-from sqlalchemy import create_engine
+from sqlalchemy import Enum as SAEnum, JSON, create_engine
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
 
+
+def _async_database_url(url: str) -> str:
+    """Map the configured database URL onto its async driver equivalent"""
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
+
+
+# Sync engine kept for scripts (init_data, migrations) and the MCP server.
+# Pool sized well above the QueuePool default (5+10) so concurrent tool calls
+# don't hit the pool-exhaustion TimeoutError cliff; pre_ping/recycle guard
+# against stale connections on long-lived processes.
 engine = create_engine(
-    settings.DATABASE_URL, 
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
+    settings.DATABASE_URL,
+    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {},
+    **({} if "sqlite" in settings.DATABASE_URL else {
+        "pool_size": 20,
+        "max_overflow": 20,
+        "pool_timeout": 30,
+        "pool_pre_ping": True,
+        "pool_recycle": 3600,
+    })
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base = declarative_base()
\ No newline at end of file
+# Async engine used by the API endpoints so DB I/O doesn't block the event
+# loop. insertmanyvalues batches multi-row executemany inserts into pages
+# of single statements over asyncpg's binary protocol. No pre_ping on this
+# pool: that SELECT 1 per checkout is a round trip on every request, and
+# the 30-minute recycle already turns over connections before cloud LBs
+# kill them idle.
+async_engine = create_async_engine(
+    _async_database_url(settings.DATABASE_URL),
+    pool_pre_ping=False,
+    pool_recycle=1800,
+    insertmanyvalues_page_size=500,
+    **({} if "sqlite" in settings.DATABASE_URL else {"pool_size": 20, "max_overflow": 40})
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+Base = declarative_base()
+
+# JSONB on PostgreSQL - binary storage, no re-parse on read, GIN-indexable
+# with @>/? operators - while staying plain JSON on SQLite
+JSONVariant = JSON().with_variant(JSONB(), "postgresql")
+
+
+def string_enum(enum_cls):
+    """Enum column stored as a short VARCHAR with a CHECK constraint
+    rather than a native PostgreSQL TYPE: values go over the wire as
+    plain strings (no per-row OID decoding) and adding a member is a
+    constraint swap instead of an ALTER TYPE. String writes skip the
+    Python-side membership check - create_constraint makes the CHECK
+    the single authority, so the value isn't validated twice per row."""
+    return SAEnum(
+        enum_cls,
+        native_enum=False,
+        create_constraint=True,
+        values_callable=lambda e: [m.value for m in e],
+        validate_strings=False
+    )
@@ -3,8 +3,9 @@ from .conversation import (
     ConversationStatus, ConversationChannel, MessageSenderType, SupportActionStatus
 )
 from .organization import (
-    Organization, User, APIKey, APIUsageLog,
-    OrganizationPlan, OrganizationStatus, UserRole, APIKeyScope
+    Organization, User, APIKey, APIUsageLog, OrgMonthlyUsage,
+    OrganizationPlan, OrganizationStatus, UserRole, APIKeyScope,
+    record_monthly_usage, current_year_month
 )
 from .knowledge_base import (
     KnowledgeBase, Document, DocumentChunk, SearchQuery, KnowledgeBaseAccess,
@@ -17,8 +18,9 @@ __all__ = [
     "ConversationStatus", "ConversationChannel", "MessageSenderType", "SupportActionStatus",
     
     # Organization models
-    "Organization", "User", "APIKey", "APIUsageLog",
+    "Organization", "User", "APIKey", "APIUsageLog", "OrgMonthlyUsage",
     "OrganizationPlan", "OrganizationStatus", "UserRole", "APIKeyScope",
+    "record_monthly_usage", "current_year_month",
     
     # Knowledge base models
     "KnowledgeBase", "Document", "DocumentChunk", "SearchQuery", "KnowledgeBaseAccess",
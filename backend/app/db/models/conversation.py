@@ -1,7 +1,7 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, JSON, Enum
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Index, JSON, Enum, UniqueConstraint, event, select
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from app.db.base import Base
+from app.db.base import Base, JSONVariant, string_enum
 import enum
 
 
@@ -34,8 +34,8 @@ class Conversation(Base):
     customer_id = Column(String, index=True)  # External customer ID
     
     # Conversation details
-    status = Column(Enum(ConversationStatus), default=ConversationStatus.ACTIVE)
-    channel = Column(Enum(ConversationChannel), default=ConversationChannel.WEB_CHAT)
+    status = Column(string_enum(ConversationStatus), default=ConversationStatus.ACTIVE)
+    channel = Column(string_enum(ConversationChannel), default=ConversationChannel.WEB_CHAT)
     priority = Column(String, default="normal")  # low, normal, high, urgent
     
     # Assignment
@@ -52,17 +52,26 @@ class Conversation(Base):
     customer_satisfaction_score = Column(Integer)  # 1-5 rating
     
     # Metadata
-    conversation_metadata = Column(JSON, default={})  # Custom fields, tags, etc.
+    conversation_metadata = Column(JSONVariant, default=dict)  # Custom fields, tags, etc.
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
     organization = relationship("Organization", back_populates="conversations")
     assigned_to = relationship("User")
-    system_prompt = relationship("SystemPrompt")
-    messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
+    system_prompt = relationship("SystemPrompt", back_populates="conversations")
+    messages = relationship(
+        "Message", back_populates="conversation", cascade="all, delete-orphan",
+        order_by="Message.created_at"
+    )
     support_actions = relationship("SupportAction", back_populates="conversation", cascade="all, delete-orphan")
 
+    # Composite index for status-filtered listings ordered by recency
+    __table_args__ = (
+        Index("ix_conversations_status_created", "status", "created_at"),
+        Index("ix_conversations_org_created", "organization_id", "created_at"),
+    )
+
 
 class MessageSenderType(str, enum.Enum):
     CUSTOMER = "customer"
@@ -82,18 +91,22 @@ class Message(Base):
     content = Column(Text, nullable=False)
     content_type = Column(String, default="text")  # text, markdown, html
     
+    # Denormalized from the parent conversation so per-channel message
+    # analytics group without a JOIN; filled by the before_insert hook
+    channel = Column(string_enum(ConversationChannel))
+
     # Sender info
-    sender_type = Column(Enum(MessageSenderType), nullable=False)
+    sender_type = Column(string_enum(MessageSenderType), nullable=False)
     sender_id = Column(String)  # User ID for human agents, customer ID for customers
     sender_name = Column(String)  # Display name
     
     # AI-specific fields
     ai_model = Column(String)  # Model used for AI responses
     ai_confidence = Column(Integer)  # 0-100 confidence score
-    ai_tools_used = Column(JSON)  # List of MCP tools used
+    ai_tools_used = Column(JSONVariant)  # List of MCP tools used
     
     # Message metadata
-    message_metadata = Column(JSON, default={})  # Additional data, attachments, etc.
+    message_metadata = Column(JSONVariant, default=dict)  # Additional data, attachments, etc.
     
     # Performance tracking
     processing_time_ms = Column(Integer)  # Time to generate response
@@ -105,6 +118,25 @@ class Message(Base):
     conversation = relationship("Conversation", back_populates="messages")
     organization = relationship("Organization")
 
+    # Composite index serving per-conversation history and last-message queries
+    __table_args__ = (
+        Index("ix_messages_conv_created", "conversation_id", "created_at"),
+        Index("ix_messages_org_created", "organization_id", "created_at"),
+    )
+
+
+@event.listens_for(Message, "before_insert")
+def _denormalize_message_channel(mapper, connection, target):
+    """Copy the parent conversation's channel onto the message at insert"""
+    if target.channel is not None:
+        return
+    if target.conversation is not None:
+        target.channel = target.conversation.channel
+    elif target.conversation_id is not None:
+        target.channel = connection.execute(
+            select(Conversation.channel).where(Conversation.id == target.conversation_id)
+        ).scalar()
+
 
 class SystemPrompt(Base):
     __tablename__ = "system_prompts"
@@ -114,7 +146,7 @@ class SystemPrompt(Base):
     created_by_user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     
     # Prompt details
-    name = Column(String(255), nullable=False, index=True)
+    name = Column(String(255), nullable=False, unique=True, index=True)
     content = Column(Text, nullable=False)
     description = Column(Text)
     
@@ -124,7 +156,7 @@ class SystemPrompt(Base):
     department = Column(String, default="general")  # general, billing, technical, etc.
     
     # AI model settings
-    model_settings = Column(JSON, default={})  # Temperature, max tokens, etc.
+    model_settings = Column(JSONVariant, default=dict)  # Temperature, max tokens, etc.
     
     # Usage tracking
     usage_count = Column(Integer, default=0)
@@ -158,7 +190,7 @@ class Customer(Base):
     total_spent = Column(String(50))  # Store as string to avoid float precision issues
     
     # Customer metadata
-    customer_metadata = Column(JSON, default={})  # Custom fields, tags, preferences
+    customer_metadata = Column(JSONVariant, default=dict)  # Custom fields, tags, preferences
     
     # Analytics
     total_conversations = Column(Integer, default=0)
@@ -172,6 +204,12 @@ class Customer(Base):
     # Relationships
     organization = relationship("Organization")
 
+    # One customer record per email within a tenant; also the conflict
+    # target for idempotent ON CONFLICT seeding
+    __table_args__ = (
+        UniqueConstraint("organization_id", "email", name="uq_customers_org_email"),
+    )
+
 
 class SupportActionStatus(str, enum.Enum):
     PENDING = "pending"
@@ -190,15 +228,16 @@ class SupportAction(Base):
     
     # Action details
     action_type = Column(String(100), nullable=False)  # refund, cancel_subscription, update_plan, etc.
-    action_data = Column(JSON, default={})  # Store action-specific data
+    action_category = Column(String(50), index=True)  # refund, subscription, escalation, ...
+    action_data = Column(JSONVariant, default=dict)  # Store action-specific data
     
     # Execution
-    status = Column(Enum(SupportActionStatus), default=SupportActionStatus.PENDING)
+    status = Column(string_enum(SupportActionStatus), default=SupportActionStatus.PENDING)
     executed_by_user_id = Column(Integer, ForeignKey("users.id"))  # Human agent who executed
     executed_by_ai = Column(Boolean, default=False)  # Whether executed by AI
     
     # Results
-    result_data = Column(JSON, default={})  # Results of the action
+    result_data = Column(JSONVariant, default=dict)  # Results of the action
     error_message = Column(Text)  # Error details if failed
     
     # Timestamps
@@ -208,4 +247,9 @@ class SupportAction(Base):
     # Relationships
     conversation = relationship("Conversation", back_populates="support_actions")
     organization = relationship("Organization")
-    executed_by = relationship("User")
\ No newline at end of file
+    executed_by = relationship("User")
+
+    # Index for action-type counts in the analytics endpoint
+    __table_args__ = (
+        Index("ix_support_actions_action_type", "action_type"),
+    )
\ No newline at end of file
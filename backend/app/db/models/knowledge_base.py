@@ -1,9 +1,27 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, JSON, Float, LargeBinary
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Index, JSON, Float, LargeBinary
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
-from app.db.base import Base
+from app.db.base import Base, JSONVariant
 import enum
 
+try:
+    from pgvector.sqlalchemy import Vector
+    _HAS_PGVECTOR = True
+except ImportError:  # pragma: no cover - optional, PostgreSQL-only
+    _HAS_PGVECTOR = False
+
+# Dimension of the embedding model output
+EMBEDDING_DIM = 1536
+
+
+def _embedding_type():
+    """vector(EMBEDDING_DIM) on PostgreSQL (pgvector extension) so
+    similarity search runs inside the database; LargeBinary elsewhere so
+    SQLite dev setups keep working."""
+    if _HAS_PGVECTOR:
+        return LargeBinary().with_variant(Vector(EMBEDDING_DIM), "postgresql")
+    return LargeBinary()
+
 
 class DocumentStatus(str, enum.Enum):
     PENDING = "pending"      # Uploaded, waiting to be processed
@@ -42,7 +60,7 @@ class KnowledgeBase(Base):
     slug = Column(String(100), nullable=False, index=True)  # URL-friendly identifier
     
     # Configuration
-    settings = Column(JSON, default={})  # Embedding model, chunk size, etc.
+    settings = Column(JSONVariant, default=dict)  # Embedding model, chunk size, etc.
     is_public = Column(Boolean, default=False)  # Can be accessed by API without auth
     
     # Statistics
@@ -87,10 +105,11 @@ class Document(Base):
     document_type = Column(String(20), nullable=False)  # DocumentType enum
     status = Column(String(20), default=DocumentStatus.PENDING)  # DocumentStatus enum
     
-    # Content
-    raw_content = Column(Text)  # Original text content
-    processed_content = Column(Text)  # Cleaned/processed content
-    document_metadata = Column(JSON, default={})  # Author, creation date, etc.
+    # Content - deferred so listings don't drag MB-scale bodies over the
+    # wire; use undefer() where the text is actually needed
+    raw_content = deferred(Column(Text))  # Original text content
+    processed_content = deferred(Column(Text))  # Cleaned/processed content
+    document_metadata = Column(JSONVariant, default=dict)  # Author, creation date, etc.
     
     # Processing info
     processing_started_at = Column(DateTime(timezone=True))
@@ -131,12 +150,13 @@ class DocumentChunk(Base):
     end_char = Column(Integer)
     page_number = Column(Integer)  # For PDFs
     
-    # Vector embedding for semantic search
-    embedding = Column(LargeBinary)  # Stored as binary for efficiency
+    # Vector embedding for semantic search; order by
+    # embedding.cosine_distance(q) on PostgreSQL to search in-database
+    embedding = deferred(Column(_embedding_type()))
     embedding_model = Column(String(100))  # Model used for embedding
     
     # Metadata
-    chunk_metadata = Column(JSON, default={})  # Headers, context, etc.
+    chunk_metadata = Column(JSONVariant, default=dict)  # Headers, context, etc.
     token_count = Column(Integer)
     
     # Timestamps
@@ -146,6 +166,17 @@ class DocumentChunk(Base):
     document = relationship("Document", back_populates="chunks")
     organization = relationship("Organization")
 
+    # HNSW graph over the vector column; only meaningful (and only built)
+    # where pgvector is installed
+    __table_args__ = tuple(
+        [Index(
+            "ix_document_chunks_embedding_hnsw", "embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"}
+        )] if _HAS_PGVECTOR else []
+    )
+
 
 class SearchQuery(Base):
     """
@@ -159,7 +190,7 @@ class SearchQuery(Base):
     
     # Query details
     query_text = Column(Text, nullable=False)
-    query_embedding = Column(LargeBinary)  # For similarity analysis
+    query_embedding = deferred(Column(_embedding_type()))  # For similarity analysis
     
     # Results
     results_count = Column(Integer, default=0)
@@ -1,7 +1,10 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, JSON, Enum
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Index, JSON, Enum, LargeBinary, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from app.db.base import Base
+from app.db.base import Base, JSONVariant, string_enum
+from datetime import datetime
 import enum
 
 
@@ -32,14 +35,14 @@ class Organization(Base):
     domain = Column(String(255), index=True)  # Optional custom domain
     
     # Subscription & billing
-    plan = Column(Enum(OrganizationPlan), default=OrganizationPlan.FREE)
-    status = Column(Enum(OrganizationStatus), default=OrganizationStatus.TRIAL)
+    plan = Column(string_enum(OrganizationPlan), default=OrganizationPlan.FREE)
+    status = Column(string_enum(OrganizationStatus), default=OrganizationStatus.TRIAL)
     trial_ends_at = Column(DateTime(timezone=True))
     subscription_id = Column(String(255))  # External billing system ID
     
     # Configuration
-    settings = Column(JSON, default={})  # Flexible settings storage
-    branding = Column(JSON, default={})  # Logo, colors, custom CSS
+    settings = Column(JSONVariant, default=dict)  # Flexible settings storage
+    branding = Column(JSONVariant, default=dict)  # Logo, colors, custom CSS
     
     # Limits based on plan
     max_users = Column(Integer, default=5)
@@ -85,7 +88,7 @@ class User(Base):
     avatar_url = Column(String(500))
     
     # Role & permissions
-    role = Column(Enum(UserRole), default=UserRole.MEMBER)
+    role = Column(string_enum(UserRole), default=UserRole.MEMBER)
     is_active = Column(Boolean, default=True)
     
     # Metadata
@@ -94,8 +97,25 @@ class User(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
-    organization = relationship("Organization", back_populates="users")
-    
+    # joined by default: every authenticated request resolves the org, so
+    # the single-row LEFT JOIN beats a lazy SELECT wherever a User loads
+    organization = relationship("Organization", back_populates="users", lazy="joined")
+
+    # Partial index backing the active-user counts and lookups that every
+    # org endpoint filters on
+    __table_args__ = (
+        Index(
+            "ix_users_org_active", "organization_id",
+            postgresql_where=text("is_active"),
+            sqlite_where=text("is_active")
+        ),
+        # Keyset-pagination ordering for the org user listing
+        Index("ix_users_org_created_id", "organization_id", "created_at", "id"),
+        # Role-filtered lookups (permission checks, owner/admin listings)
+        # resolve within the index
+        Index("ix_users_org_role", "organization_id", "role"),
+    )
+
     def __repr__(self):
         return f"<User {self.email} ({self.role}) in {self.organization.name}>"
 
@@ -121,11 +141,12 @@ class APIKey(Base):
     
     # Key details
     name = Column(String(255), nullable=False)  # Human-readable name
-    key_hash = Column(String(255), unique=True, index=True, nullable=False)  # Hashed API key
+    key_id = Column(String(16), unique=True, index=True)  # Public lookup handle embedded in the key
+    key_hash = Column(LargeBinary(16), unique=True, index=True, nullable=False)  # HMAC-SHA256/16 of the key secret
     key_prefix = Column(String(20), index=True)  # First few chars for identification
     
     # Permissions & limits
-    scopes = Column(JSON, default=[])  # List of APIKeyScope values
+    scopes = Column(JSONVariant, default=list)  # List of APIKeyScope values
     rate_limit_per_minute = Column(Integer, default=60)
     rate_limit_per_hour = Column(Integer, default=1000)
     rate_limit_per_day = Column(Integer, default=10000)
@@ -140,10 +161,30 @@ class APIKey(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
-    organization = relationship("Organization", back_populates="api_keys")
-    created_by = relationship("User")
+    # Both many-to-ones ride the same single-row SELECT as the key itself;
+    # auth and tenancy checks read them on nearly every key load, and the
+    # list endpoints opt out with raiseload("*")
+    organization = relationship("Organization", back_populates="api_keys", lazy="joined")
+    created_by = relationship("User", lazy="joined")
     usage_logs = relationship("APIUsageLog", back_populates="api_key", cascade="all, delete-orphan")
 
+    # Composite index matching the auth lookup (key_id + is_active) and a
+    # partial index backing the active-key counts per organization
+    __table_args__ = (
+        Index("ix_api_keys_key_id_active", "key_id", "is_active"),
+        Index(
+            "ix_api_keys_org_active", "organization_id",
+            postgresql_where=text("is_active"),
+            sqlite_where=text("is_active")
+        ),
+        # Keyset-pagination ordering for the org key listing
+        Index("ix_api_keys_org_created_id", "organization_id", "created_at", "id"),
+        # GIN on the JSONB scopes (Postgres only) so containment checks
+        # like APIKey.scopes.contains(["write"]) resolve in the index
+        # instead of decoding the blob per row
+        Index("ix_api_keys_scopes_gin", "scopes", postgresql_using="gin"),
+    )
+
 
 class APIUsageLog(Base):
     """
@@ -153,7 +194,7 @@ class APIUsageLog(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     api_key_id = Column(Integer, ForeignKey("api_keys.id"), nullable=False, index=True)
-    organization_id = Column(Integer, ForeignKey("organizations.id"), nullable=False, index=True)
+    organization_id = Column(Integer, ForeignKey("organizations.id"), nullable=False)
     
     # Request details
     endpoint = Column(String(255), nullable=False)
@@ -168,8 +209,68 @@ class APIUsageLog(Base):
     # Metadata
     ip_address = Column(String(45))  # IPv4 or IPv6
     user_agent = Column(String(500))
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
-    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
     # Relationships
     api_key = relationship("APIKey", back_populates="usage_logs")
-    organization = relationship("Organization")
\ No newline at end of file
+    organization = relationship("Organization")
+
+    # Billing and analytics scan by organization + time range (optionally
+    # narrowed by endpoint); the composites replace the single-column
+    # indexes so those scans stay within one index
+    __table_args__ = (
+        Index("ix_usage_org_created", "organization_id", "created_at"),
+        Index("ix_usage_org_endpoint", "organization_id", "endpoint", "created_at"),
+    )
+
+
+class OrgMonthlyUsage(Base):
+    """
+    Per-organization monthly usage roll-up
+    Quota checks and the stats endpoint read one row here instead of
+    counting raw api_usage_logs; writers maintain it incrementally via
+    record_monthly_usage()
+    """
+    __tablename__ = "org_monthly_usage"
+
+    organization_id = Column(Integer, ForeignKey("organizations.id"), primary_key=True)
+    year_month = Column(String(7), primary_key=True)  # "YYYY-MM"
+
+    conversation_count = Column(Integer, nullable=False, default=0)
+    api_calls = Column(Integer, nullable=False, default=0)
+    tokens_used = Column(Integer, nullable=False, default=0)
+    cost_cents = Column(Integer, nullable=False, default=0)
+
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
+def current_year_month() -> str:
+    """Key for the current month's roll-up row"""
+    return datetime.utcnow().strftime("%Y-%m")
+
+
+async def record_monthly_usage(
+    db, organization_id: int,
+    conversations: int = 0, api_calls: int = 0,
+    tokens_used: int = 0, cost_cents: int = 0
+) -> None:
+    """Incrementally maintain the monthly roll-up with a single upsert"""
+    insert_fn = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    stmt = insert_fn(OrgMonthlyUsage).values(
+        organization_id=organization_id,
+        year_month=current_year_month(),
+        conversation_count=conversations,
+        api_calls=api_calls,
+        tokens_used=tokens_used,
+        cost_cents=cost_cents
+    )
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=["organization_id", "year_month"],
+        set_={
+            "conversation_count": OrgMonthlyUsage.conversation_count + conversations,
+            "api_calls": OrgMonthlyUsage.api_calls + api_calls,
+            "tokens_used": OrgMonthlyUsage.tokens_used + tokens_used,
+            "cost_cents": OrgMonthlyUsage.cost_cents + cost_cents,
+            "updated_at": func.now()
+        }
+    ))
\ No newline at end of file
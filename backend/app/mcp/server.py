@@ -1,18 +1,23 @@
 from mcp.server.fastmcp import FastMCP
 from mcp.server.fastmcp import Context
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
+import asyncio
 import google.generativeai as genai
+from sqlalchemy import insert, select, text
 from app.core.config import settings
-from app.db import get_db
+from app.db import AsyncSessionLocal
 from app.db.models import Customer, SupportAction, SystemPrompt
-from sqlalchemy.orm import Session
-import json
+import orjson
 from datetime import datetime
+from cachetools import TTLCache
 from pydantic import BaseModel, Field
 
 
-# Configure Gemini
+# Configure Gemini once at import; the shared model instance keeps its
+# underlying transport alive across calls instead of rebuilding the
+# client (and its connection setup) per request
 genai.configure(api_key=settings.GEMINI_API_KEY)
+_GEMINI_MODEL = genai.GenerativeModel('gemini-1.5-flash')
 
 # Create MCP server
 mcp = FastMCP("Customer Support AI")
@@ -37,79 +42,192 @@ class SubscriptionAction(BaseModel):
     new_plan: str = Field(default="", description="New plan name if changing plan")
 
 
-@mcp.resource("customer://{email}")
-def get_customer_info(email: str) -> CustomerInfo:
-    """Get customer information by email"""
-    db = next(get_db())
+# Customer context is read on every AI turn but changes rarely; the short
+# TTL bounds staleness while mutation paths evict their entry eagerly
+_customer_cache: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+
+# Single-entry cache for the serialized active-prompts payload
+_prompts_cache: TTLCache = TTLCache(maxsize=1, ttl=60)
+_PROMPTS_CACHE_KEY = "active_prompts"
+
+
+def invalidate_prompts_cache() -> None:
+    """Drop the cached active-prompts payload after prompt CRUD"""
+    _prompts_cache.pop(_PROMPTS_CACHE_KEY, None)
+
+
+def _customer_info_from(customer, email: str) -> CustomerInfo:
+    """Build CustomerInfo from a Customer row, with defaults when absent"""
+    if customer:
+        return CustomerInfo(
+            email=customer.email,
+            name=customer.name or "Unknown",
+            subscription_status=customer.subscription_status or "unknown",
+            subscription_plan=customer.subscription_plan or "none",
+            total_spent=customer.total_spent or "0"
+        )
+    return CustomerInfo(
+        email=email,
+        name="Unknown",
+        subscription_status="unknown",
+        subscription_plan="none",
+        total_spent="0"
+    )
+
+
+# Buffered SupportAction inserts: tools enqueue a row and await its id,
+# the flusher drains the queue into one multi-row INSERT .. RETURNING so a
+# burst of tool calls costs a single round trip and commit
+_action_queue: "asyncio.Queue[Tuple[Dict[str, Any], asyncio.Future]]" = asyncio.Queue()
+_action_flusher: Optional["asyncio.Task"] = None
+_ACTION_BATCH_SIZE = 200
+_ACTION_BATCH_WINDOW = 0.05
+
+
+async def _insert_action_batch(batch: List[Tuple[Dict[str, Any], "asyncio.Future"]]) -> None:
+    rows = [row for row, _ in batch]
     try:
-        customer = db.query(Customer).filter(Customer.email == email).first()
-        if customer:
-            return CustomerInfo(
-                email=customer.email,
-                name=customer.name or "Unknown",
-                subscription_status=customer.subscription_status or "unknown",
-                subscription_plan=customer.subscription_plan or "none",
-                total_spent=customer.total_spent or "0"
-            )
-        else:
-            # Return default customer info if not found
-            return CustomerInfo(
-                email=email,
-                name="Unknown",
-                subscription_status="unknown",
-                subscription_plan="none",
-                total_spent="0"
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                insert(SupportAction).returning(
+                    SupportAction.id, sort_by_parameter_order=True
+                ),
+                rows
             )
-    finally:
-        db.close()
+            ids = result.scalars().all()
+            await db.commit()
+        for (_, future), action_id in zip(batch, ids):
+            if not future.done():
+                future.set_result(action_id)
+    except Exception as e:
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(e)
+
+
+async def _action_flush_loop() -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await _action_queue.get()]
+        deadline = loop.time() + _ACTION_BATCH_WINDOW
+        while len(batch) < _ACTION_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_action_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        await _insert_action_batch(batch)
+
+
+def _schedule_action_flush() -> None:
+    global _action_flusher
+    if _action_flusher is None or _action_flusher.done():
+        _action_flusher = asyncio.create_task(_action_flush_loop())
+
+
+async def _log_support_action(row: Dict[str, Any], immediate: bool = False) -> int:
+    """Queue a SupportAction row and return its generated id.
+
+    immediate=True bypasses the queue for actions that must be durable
+    before the response goes out (escalations)."""
+    future: "asyncio.Future[int]" = asyncio.get_running_loop().create_future()
+    if immediate:
+        await _insert_action_batch([(row, future)])
+    else:
+        await _action_queue.put((row, future))
+        _schedule_action_flush()
+    return await future
+
+
+@mcp.resource("customer://{email}")
+async def get_customer_info(email: str) -> CustomerInfo:
+    """Get customer information by email"""
+    cached = _customer_cache.get(email)
+    if cached is not None:
+        return cached
+
+    async with AsyncSessionLocal() as db:
+        customer = await db.scalar(select(Customer).where(Customer.email == email))
+        info = _customer_info_from(customer, email)
+
+    _customer_cache[email] = info
+    return info
+
+
+# The database builds the JSON payload itself - no ORM rows, no Python
+# dicts, no encode; we pass the aggregated text straight through
+_PROMPTS_AGG_SQL = {
+    "postgresql": text(
+        "SELECT coalesce(json_agg(json_build_object("
+        "'name', name, 'content', content, "
+        "'department', department, 'description', description"
+        ")), '[]'::json)::text FROM system_prompts WHERE is_active"
+    ),
+    "sqlite": text(
+        "SELECT coalesce(json_group_array(json_object("
+        "'name', name, 'content', content, "
+        "'department', department, 'description', description"
+        ")), '[]') FROM system_prompts WHERE is_active"
+    ),
+}
 
 
 @mcp.resource("system-prompts://active")
-def get_active_system_prompts() -> str:
+async def get_active_system_prompts() -> str:
     """Get all active system prompts"""
-    db = next(get_db())
-    try:
-        prompts = db.query(SystemPrompt).filter(SystemPrompt.is_active == True).all()
-        prompt_data = []
-        for prompt in prompts:
-            prompt_data.append({
-                "name": prompt.name,
-                "content": prompt.content,
-                "department": prompt.department,
-                "description": prompt.description
-            })
-        return json.dumps(prompt_data, indent=2)
-    finally:
-        db.close()
+    cached = _prompts_cache.get(_PROMPTS_CACHE_KEY)
+    if cached is not None:
+        return cached
+
+    async with AsyncSessionLocal() as db:
+        stmt = _PROMPTS_AGG_SQL.get(db.get_bind().dialect.name)
+        if stmt is not None:
+            payload = await db.scalar(stmt)
+        else:
+            result = await db.execute(
+                select(SystemPrompt).where(SystemPrompt.is_active == True)
+            )
+            payload = orjson.dumps([
+                {
+                    "name": prompt.name,
+                    "content": prompt.content,
+                    "department": prompt.department,
+                    "description": prompt.description
+                }
+                for prompt in result.scalars()
+            ]).decode()
+
+    _prompts_cache[_PROMPTS_CACHE_KEY] = payload
+    return payload
 
 
 @mcp.tool()
-def process_refund(customer_email: str, refund_data: RefundRequest, ctx: Context) -> Dict[str, Any]:
+async def process_refund(customer_email: str, refund_data: RefundRequest, ctx: Context) -> Dict[str, Any]:
     """Process a refund request for a customer"""
-    db = next(get_db())
     try:
-        # Log the refund action
-        action = SupportAction(
-            conversation_id=0,  # Will be updated when integrated with conversation
-            action_type="refund",
-            action_data={
+        # Log the refund action through the batched insert queue
+        action_id = await _log_support_action({
+            "conversation_id": 0,  # Will be updated when integrated with conversation
+            "action_type": "refund",
+            "action_category": "refund",
+            "action_data": {
                 "customer_email": customer_email,
                 "amount": refund_data.amount,
                 "reason": refund_data.reason,
                 "order_id": refund_data.order_id
             },
-            status="completed",
-            executed_at=datetime.utcnow()
-        )
-        db.add(action)
-        db.commit()
-        
+            "status": "completed",
+            "executed_at": datetime.utcnow()
+        })
+
         ctx.info(f"Processed refund of {refund_data.amount} for customer {customer_email}")
-        
+
         return {
             "success": True,
             "message": f"Refund of {refund_data.amount} has been processed for order {refund_data.order_id}",
-            "refund_id": f"REF-{action.id}",
+            "refund_id": f"REF-{action_id}",
             "amount": refund_data.amount,
             "status": "completed"
         }
@@ -119,95 +237,95 @@ def process_refund(customer_email: str, refund_data: RefundRequest, ctx: Context
             "success": False,
             "message": f"Failed to process refund: {str(e)}"
         }
-    finally:
-        db.close()
 
 
 @mcp.tool()
-def manage_subscription(customer_email: str, subscription_action: SubscriptionAction, ctx: Context) -> Dict[str, Any]:
+async def manage_subscription(customer_email: str, subscription_action: SubscriptionAction, ctx: Context) -> Dict[str, Any]:
     """Manage customer subscription (cancel, pause, or change plan)"""
-    db = next(get_db())
-    try:
-        customer = db.query(Customer).filter(Customer.email == customer_email).first()
-        if not customer:
+    async with AsyncSessionLocal() as db:
+        try:
+            customer = await db.scalar(
+                select(Customer).where(Customer.email == customer_email)
+            )
+            if not customer:
+                return {
+                    "success": False,
+                    "message": "Customer not found"
+                }
+
+            # Log the subscription action through the batched insert queue
+            action_id = await _log_support_action({
+                "conversation_id": 0,  # Will be updated when integrated with conversation
+                "action_type": f"subscription_{subscription_action.action}",
+                "action_category": "subscription",
+                "action_data": {
+                    "customer_email": customer_email,
+                    "action": subscription_action.action,
+                    "old_plan": customer.subscription_plan,
+                    "new_plan": subscription_action.new_plan if subscription_action.action == "change_plan" else None
+                },
+                "status": "completed",
+                "executed_at": datetime.utcnow()
+            })
+
+            # Update customer subscription
+            if subscription_action.action == "cancel":
+                customer.subscription_status = "cancelled"
+                message = "Subscription has been cancelled successfully"
+            elif subscription_action.action == "pause":
+                customer.subscription_status = "paused"
+                message = "Subscription has been paused successfully"
+            elif subscription_action.action == "change_plan":
+                customer.subscription_plan = subscription_action.new_plan
+                message = f"Subscription plan changed to {subscription_action.new_plan}"
+
+            await db.commit()
+
+            # The cached snapshot is now stale
+            _customer_cache.pop(customer_email, None)
+
+            ctx.info(f"Subscription {subscription_action.action} completed for {customer_email}")
+
+            return {
+                "success": True,
+                "message": message,
+                "action_id": f"SUB-{action_id}",
+                "new_status": customer.subscription_status,
+                "new_plan": customer.subscription_plan
+            }
+        except Exception as e:
+            ctx.error(f"Failed to manage subscription: {str(e)}")
             return {
                 "success": False,
-                "message": "Customer not found"
+                "message": f"Failed to manage subscription: {str(e)}"
             }
-        
-        # Log the subscription action
-        action = SupportAction(
-            conversation_id=0,  # Will be updated when integrated with conversation
-            action_type=f"subscription_{subscription_action.action}",
-            action_data={
-                "customer_email": customer_email,
-                "action": subscription_action.action,
-                "old_plan": customer.subscription_plan,
-                "new_plan": subscription_action.new_plan if subscription_action.action == "change_plan" else None
-            },
-            status="completed",
-            executed_at=datetime.utcnow()
-        )
-        db.add(action)
-        
-        # Update customer subscription
-        if subscription_action.action == "cancel":
-            customer.subscription_status = "cancelled"
-            message = "Subscription has been cancelled successfully"
-        elif subscription_action.action == "pause":
-            customer.subscription_status = "paused"
-            message = "Subscription has been paused successfully"
-        elif subscription_action.action == "change_plan":
-            customer.subscription_plan = subscription_action.new_plan
-            message = f"Subscription plan changed to {subscription_action.new_plan}"
-        
-        db.commit()
-        
-        ctx.info(f"Subscription {subscription_action.action} completed for {customer_email}")
-        
-        return {
-            "success": True,
-            "message": message,
-            "action_id": f"SUB-{action.id}",
-            "new_status": customer.subscription_status,
-            "new_plan": customer.subscription_plan
-        }
-    except Exception as e:
-        ctx.error(f"Failed to manage subscription: {str(e)}")
-        return {
-            "success": False,
-            "message": f"Failed to manage subscription: {str(e)}"
-        }
-    finally:
-        db.close()
 
 
 @mcp.tool()
-def escalate_to_human(customer_email: str, reason: str, conversation_summary: str, ctx: Context) -> Dict[str, Any]:
+async def escalate_to_human(customer_email: str, reason: str, conversation_summary: str, ctx: Context) -> Dict[str, Any]:
     """Escalate conversation to human agent"""
-    db = next(get_db())
     try:
-        # Log the escalation
-        action = SupportAction(
-            conversation_id=0,  # Will be updated when integrated with conversation
-            action_type="escalate_to_human",
-            action_data={
+        # Escalations must be durable before we promise a human follow-up,
+        # so this skips the batching window
+        action_id = await _log_support_action({
+            "conversation_id": 0,  # Will be updated when integrated with conversation
+            "action_type": "escalate_to_human",
+            "action_category": "escalation",
+            "action_data": {
                 "customer_email": customer_email,
                 "reason": reason,
                 "summary": conversation_summary
             },
-            status="pending",
-            executed_at=datetime.utcnow()
-        )
-        db.add(action)
-        db.commit()
-        
+            "status": "pending",
+            "executed_at": datetime.utcnow()
+        }, immediate=True)
+
         ctx.info(f"Escalated conversation for {customer_email} to human agent")
-        
+
         return {
             "success": True,
             "message": "Your conversation has been escalated to a human agent. You will be contacted shortly.",
-            "escalation_id": f"ESC-{action.id}",
+            "escalation_id": f"ESC-{action_id}",
             "estimated_wait_time": "5-10 minutes"
         }
     except Exception as e:
@@ -216,23 +334,21 @@ def escalate_to_human(customer_email: str, reason: str, conversation_summary: st
             "success": False,
             "message": f"Failed to escalate: {str(e)}"
         }
-    finally:
-        db.close()
 
 
 @mcp.tool()
-def generate_ai_response(
-    customer_message: str, 
-    customer_email: str, 
+async def generate_ai_response(
+    customer_message: str,
+    customer_email: str,
     conversation_history: List[Dict[str, str]]
 ) -> Dict[str, Any]:
     """Generate AI response using Gemini API with customer context"""
     try:
-        # Get customer info
-        customer_info = get_customer_info(customer_email)
-        
+        # Get customer info (TTL-cached; a miss is one async query)
+        customer_info = await get_customer_info(customer_email)
+
         # Build a simple context for Gemini
-        context = f"""You are a helpful customer support AI assistant. 
+        context = f"""You are a helpful customer support AI assistant.
 
 Customer Information:
 - Email: {customer_info.email}
@@ -243,11 +359,11 @@ Customer Information:
 Customer Message: {customer_message}
 
 Please provide a helpful, empathetic response. Be professional and offer to help with their inquiry."""
-        
-        # Generate response using Gemini
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        response = model.generate_content(context)
-        
+
+        # Generate response using Gemini's async API so the event loop
+        # keeps serving other conversations during the LLM round trip
+        response = await _GEMINI_MODEL.generate_content_async(context)
+
         return {
             "success": True,
             "response": response.text,
@@ -279,4 +395,4 @@ Guidelines:
 - If you need to perform actions like refunds or subscription changes, use the appropriate tools
 - If the issue is complex or you're unsure, escalate to a human agent
 - Always confirm customer details before taking any actions
-"""
\ No newline at end of file
+"""
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field, EmailStr
-from typing import Optional, List, Dict, Any
+from pydantic import BaseModel, ConfigDict, Field, EmailStr, TypeAdapter
+from typing import Literal, Optional, List, Dict, Any
 from datetime import datetime
 from app.db.models import (
     ConversationStatus, ConversationChannel, MessageSenderType, SupportActionStatus
@@ -12,7 +12,7 @@ class ConversationBase(BaseModel):
     customer_name: Optional[str] = Field(None, max_length=255)
     customer_id: Optional[str] = Field(None, max_length=255)
     channel: ConversationChannel = ConversationChannel.WEB_CHAT
-    priority: str = Field("normal", pattern=r'^(low|normal|high|urgent)$')
+    priority: Literal["low", "normal", "high", "urgent"] = "normal"
     ai_enabled: bool = True
 
 
@@ -25,7 +25,7 @@ class ConversationUpdate(BaseModel):
     customer_name: Optional[str] = Field(None, max_length=255)
     customer_id: Optional[str] = Field(None, max_length=255)
     status: Optional[ConversationStatus] = None
-    priority: Optional[str] = Field(None, pattern=r'^(low|normal|high|urgent)$')
+    priority: Optional[Literal["low", "normal", "high", "urgent"]] = None
     assigned_to_user_id: Optional[int] = None
     ai_enabled: Optional[bool] = None
     system_prompt_id: Optional[int] = None
@@ -47,14 +47,13 @@ class ConversationResponse(ConversationBase):
     created_at: datetime
     updated_at: Optional[datetime]
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # Message schemas
 class MessageBase(BaseModel):
     content: str = Field(..., min_length=1)
-    content_type: str = Field("text", pattern=r'^(text|markdown|html)$')
+    content_type: Literal["text", "markdown", "html"] = "text"
     sender_type: MessageSenderType
     sender_name: Optional[str] = Field(None, max_length=255)
 
@@ -67,7 +66,7 @@ class MessageCreate(MessageBase):
 
 class MessageUpdate(BaseModel):
     content: Optional[str] = Field(None, min_length=1)
-    content_type: Optional[str] = Field(None, pattern=r'^(text|markdown|html)$')
+    content_type: Optional[Literal["text", "markdown", "html"]] = None
     message_metadata: Optional[Dict[str, Any]] = None
 
 
@@ -83,8 +82,7 @@ class MessageResponse(MessageBase):
     processing_time_ms: Optional[int]
     created_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # System Prompt schemas
@@ -121,8 +119,7 @@ class SystemPromptResponse(SystemPromptBase):
     created_at: datetime
     updated_at: Optional[datetime]
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # Support Action schemas
@@ -153,8 +150,7 @@ class SupportActionResponse(SupportActionBase):
     executed_at: Optional[datetime]
     created_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # Customer schemas
@@ -191,8 +187,7 @@ class CustomerResponse(CustomerBase):
     created_at: datetime
     updated_at: Optional[datetime]
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # Chat API schemas (for external clients)
@@ -241,4 +236,9 @@ class MessageAnalytics(BaseModel):
     messages_by_sender_type: Dict[str, int]
     avg_ai_confidence: Optional[float]
     avg_processing_time_ms: Optional[float]
-    most_used_ai_tools: List[Dict[str, Any]]
\ No newline at end of file
+    most_used_ai_tools: List[Dict[str, Any]]
+
+# Shared adapters for list payloads: one precompiled validator handles a
+# whole batch of rows instead of instantiating models item by item
+CONVERSATION_LIST_ADAPTER = TypeAdapter(List[ConversationResponse])
+MESSAGE_LIST_ADAPTER = TypeAdapter(List[MessageResponse])
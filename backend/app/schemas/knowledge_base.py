@@ -1,9 +1,24 @@
-from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from pydantic import AfterValidator, BaseModel, ConfigDict, Field, TypeAdapter
+from typing import Annotated, Optional, List, Dict, Any
 from datetime import datetime
+import re
 from app.db.models import DocumentStatus, DocumentType
 
 
+# Compiled once at import; slug validation is a single anchored match
+# instead of a per-field pattern evaluation
+_SLUG_RE = re.compile(r'^[a-z0-9-]+$')
+
+
+def _validate_slug(value: str) -> str:
+    if not _SLUG_RE.match(value):
+        raise ValueError("slug may only contain lowercase letters, digits and hyphens")
+    return value
+
+
+Slug = Annotated[str, Field(min_length=1, max_length=100), AfterValidator(_validate_slug)]
+
+
 # Knowledge Base schemas
 class KnowledgeBaseBase(BaseModel):
     name: str = Field(..., min_length=1, max_length=255)
@@ -13,7 +28,7 @@ class KnowledgeBaseBase(BaseModel):
 
 
 class KnowledgeBaseCreate(KnowledgeBaseBase):
-    slug: str = Field(..., min_length=1, max_length=100, pattern=r'^[a-z0-9-]+$')
+    slug: Slug
 
 
 class KnowledgeBaseUpdate(BaseModel):
@@ -34,8 +49,7 @@ class KnowledgeBaseResponse(KnowledgeBaseBase):
     created_at: datetime
     updated_at: Optional[datetime]
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # Document schemas
@@ -74,8 +88,7 @@ class DocumentResponse(DocumentBase):
     created_at: datetime
     updated_at: Optional[datetime]
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # Document Chunk schemas
@@ -92,8 +105,7 @@ class DocumentChunkResponse(BaseModel):
     token_count: Optional[int]
     created_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # Search schemas
@@ -168,4 +180,9 @@ class DocumentProcessingStatus(BaseModel):
     progress_percentage: int
     processing_started_at: Optional[datetime]
     estimated_completion_at: Optional[datetime]
-    error_message: Optional[str]
\ No newline at end of file
+    error_message: Optional[str]
+
+# Prebuilt at import so the hot search path serializes result batches
+# through one specialized pydantic-core serializer instead of per-item
+# model dispatch
+SEARCH_RESULT_LIST_ADAPTER = TypeAdapter(List[SearchResult])
@@ -1,24 +1,54 @@
 from typing import Dict, Any, List, Optional
-from sqlalchemy.orm import Session
-from app.db.models import Conversation, Message, Customer
+from sqlalchemy import select, func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from app.db.models import Conversation, Message, Customer, record_monthly_usage
 from app.mcp.server import generate_ai_response
+import orjson
 import uuid
-from datetime import datetime
-import google.generativeai as genai
-from app.core.config import settings
+
+
+# History as a single JSON aggregate built in the database - no ORM
+# instance per message. Keyed by dialect like the prompts aggregate in
+# the MCP server; anything else falls back to ORM loading.
+_HISTORY_AGG_SQL = {
+    "postgresql": text(
+        # jsonb throughout: message_metadata is JSONB on Postgres and
+        # COALESCE cannot mix jsonb with json
+        "SELECT coalesce(jsonb_agg(jsonb_build_object("
+        "'id', m.id, 'content', m.content, 'sender', m.sender_type, "
+        "'timestamp', m.created_at, "
+        "'metadata', coalesce(m.message_metadata, '{}'::jsonb)"
+        ") ORDER BY m.created_at), '[]'::jsonb)::text "
+        "FROM messages m JOIN conversations c ON m.conversation_id = c.id "
+        "WHERE c.session_id = :sid"
+    ),
+    "sqlite": text(
+        "SELECT coalesce(json_group_array(json_object("
+        "'id', id, 'content', content, 'sender', sender_type, "
+        "'timestamp', created_at, "
+        "'metadata', json(coalesce(message_metadata, '{}'))"
+        ")), '[]') FROM ("
+        "SELECT m.* FROM messages m "
+        "JOIN conversations c ON m.conversation_id = c.id "
+        "WHERE c.session_id = :sid ORDER BY m.created_at)"
+    ),
+}
 
 
 class ChatService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-    
+
     async def create_conversation(self, customer_email: str, customer_name: Optional[str] = None) -> str:
         """Create a new conversation and return session_id"""
-        session_id = str(uuid.uuid4())
-        
+        # .hex skips the dashed formatting and keeps index keys at 32 chars
+        session_id = uuid.uuid4().hex
+
         # Create or get customer
-        customer = self.db.query(Customer).filter(Customer.email == customer_email).first()
+        customer = await self.db.scalar(
+            select(Customer).where(Customer.email == customer_email)
+        )
         if not customer:
             customer = Customer(
                 email=customer_email,
@@ -28,165 +58,184 @@ class ChatService:
                 total_spent="0"
             )
             self.db.add(customer)
-            self.db.flush()
-        
-        # Create conversation
+            await self.db.flush()
+
+        # Create conversation, inheriting the tenant from the customer
         conversation = Conversation(
             session_id=session_id,
             customer_email=customer_email,
             customer_name=customer_name or customer.name,
+            organization_id=customer.organization_id,
             status="active"
         )
         self.db.add(conversation)
-        self.db.commit()
-        
+        # Bump the monthly roll-up in the same transaction so
+        # conversation_count stays consistent with the rows it counts
+        if conversation.organization_id is not None:
+            await record_monthly_usage(
+                self.db, conversation.organization_id, conversations=1
+            )
+        await self.db.commit()
+
         return session_id
-    
+
+    async def _load_conversation(self, session_id: str) -> Optional[Conversation]:
+        """One round trip for the conversation plus its ordered messages"""
+        return await self.db.scalar(
+            select(Conversation)
+            .options(selectinload(Conversation.messages))
+            .where(Conversation.session_id == session_id)
+        )
+
+    @staticmethod
+    def _format_history(messages) -> List[Dict[str, str]]:
+        """Shape already-loaded messages for the AI context"""
+        return [
+            {
+                "id": message.id,
+                "content": message.content,
+                "sender": message.sender_type,
+                "timestamp": message.created_at.isoformat(),
+                "metadata": message.message_metadata or {}
+            }
+            for message in messages
+        ]
+
     async def send_message(self, session_id: str, content: str, sender_type: str = "customer") -> Dict[str, Any]:
         """Send a message and get AI response if sender is customer"""
-        conversation = self.db.query(Conversation).filter(
-            Conversation.session_id == session_id
-        ).first()
-        
+        conversation = await self._load_conversation(session_id)
+
         if not conversation:
             raise ValueError("Conversation not found")
-        
-        # Save customer message
+
+        # Format history from the already-persisted messages before the
+        # new one joins the collection; the current message goes to the AI
+        # separately as customer_message
+        history = self._format_history(conversation.messages)
+
+        # Save customer message; assigning the relationship keeps the
+        # loaded history collection current without another query.
+        # No timestamp in metadata - created_at already records it.
         customer_message = Message(
-            conversation_id=conversation.id,
+            conversation=conversation,
             content=content,
-            sender_type=sender_type,
-            message_metadata={"timestamp": datetime.utcnow().isoformat()}
+            sender_type=sender_type
         )
         self.db.add(customer_message)
-        self.db.flush()
-        
-        response_data = {"message_id": customer_message.id}
-        
+
+        ai_response = None
+        ai_message = None
+
         # Generate AI response if customer sent the message
         if sender_type == "customer":
-            # Get conversation history
-            history = self.get_conversation_history(session_id)
-            
             # Generate AI response using MCP
-            ai_response = generate_ai_response(
+            ai_response = await generate_ai_response(
                 customer_message=content,
                 customer_email=conversation.customer_email,
                 conversation_history=history
             )
-            
+
             if ai_response["success"]:
-                # Save AI response
                 ai_message = Message(
                     conversation_id=conversation.id,
                     content=ai_response["response"],
                     sender_type="ai",
                     message_metadata={
                         "confidence": ai_response.get("confidence", 0.0),
-                        "suggested_actions": ai_response.get("suggested_actions", []),
-                        "timestamp": datetime.utcnow().isoformat()
+                        "suggested_actions": ai_response.get("suggested_actions", [])
                     }
                 )
-                self.db.add(ai_message)
-                self.db.commit()
-                
-                response_data.update({
-                    "ai_response": ai_response["response"],
-                    "ai_message_id": ai_message.id,
-                    "confidence": ai_response.get("confidence", 0.0)
-                })
             else:
-                # Handle AI error
-                error_message = Message(
+                ai_message = Message(
                     conversation_id=conversation.id,
                     content="I apologize, but I'm experiencing technical difficulties. Let me connect you with a human agent.",
                     sender_type="ai",
                     message_metadata={
-                        "error": ai_response.get("error", "Unknown error"),
-                        "timestamp": datetime.utcnow().isoformat()
+                        "error": ai_response.get("error", "Unknown error")
                     }
                 )
-                self.db.add(error_message)
-                self.db.commit()
-                
+            self.db.add(ai_message)
+
+        # One commit (one fsync) per chat turn covers both rows
+        await self.db.commit()
+
+        response_data = {"message_id": customer_message.id}
+
+        if ai_message is not None:
+            if ai_response["success"]:
+                response_data.update({
+                    "ai_response": ai_message.content,
+                    "ai_message_id": ai_message.id,
+                    "confidence": ai_response.get("confidence", 0.0)
+                })
+            else:
                 response_data.update({
-                    "ai_response": error_message.content,
-                    "ai_message_id": error_message.id,
+                    "ai_response": ai_message.content,
+                    "ai_message_id": ai_message.id,
                     "error": True
                 })
-        else:
-            self.db.commit()
-        
+
         return response_data
-    
-    def get_conversation_history(self, session_id: str) -> List[Dict[str, str]]:
+
+    async def get_conversation_history(self, session_id: str) -> List[Dict[str, str]]:
         """Get conversation history"""
-        conversation = self.db.query(Conversation).filter(
-            Conversation.session_id == session_id
-        ).first()
-        
+        stmt = _HISTORY_AGG_SQL.get(self.db.get_bind().dialect.name)
+        if stmt is not None:
+            payload = await self.db.scalar(stmt, {"sid": session_id})
+            return orjson.loads(payload) if payload else []
+
+        conversation = await self._load_conversation(session_id)
+
         if not conversation:
             return []
-        
-        messages = self.db.query(Message).filter(
-            Message.conversation_id == conversation.id
-        ).order_by(Message.created_at).all()
-        
-        history = []
-        for message in messages:
-            history.append({
-                "id": message.id,
-                "content": message.content,
-                "sender": message.sender_type,
-                "timestamp": message.created_at.isoformat(),
-                "metadata": message.message_metadata or {}
-            })
-        
-        return history
-    
-    def escalate_conversation(self, session_id: str, reason: str) -> Dict[str, Any]:
+
+        return self._format_history(conversation.messages)
+
+    async def escalate_conversation(self, session_id: str, reason: str) -> Dict[str, Any]:
         """Escalate conversation to human agent"""
-        conversation = self.db.query(Conversation).filter(
-            Conversation.session_id == session_id
-        ).first()
-        
+        conversation = await self.db.scalar(
+            select(Conversation).where(Conversation.session_id == session_id)
+        )
+
         if not conversation:
             raise ValueError("Conversation not found")
-        
+
         conversation.status = "escalated"
-        
+
         # Add escalation message
         escalation_message = Message(
             conversation_id=conversation.id,
             content=f"Conversation escalated to human agent. Reason: {reason}",
             sender_type="system",
             message_metadata={
-                "escalation_reason": reason,
-                "timestamp": datetime.utcnow().isoformat()
+                "escalation_reason": reason
             }
         )
         self.db.add(escalation_message)
-        self.db.commit()
-        
+        await self.db.commit()
+
         return {
             "success": True,
             "message": "Conversation has been escalated to a human agent",
             "estimated_wait_time": "5-10 minutes"
         }
-    
-    def get_conversation_summary(self, session_id: str) -> Dict[str, Any]:
+
+    async def get_conversation_summary(self, session_id: str) -> Dict[str, Any]:
         """Get conversation summary"""
-        conversation = self.db.query(Conversation).filter(
-            Conversation.session_id == session_id
-        ).first()
-        
-        if not conversation:
+        # Conversation and message count in one round trip; session_id is
+        # unique so the group collapses to a single row
+        row = (await self.db.execute(
+            select(Conversation, func.count(Message.id))
+            .outerjoin(Message)
+            .where(Conversation.session_id == session_id)
+            .group_by(Conversation.id)
+        )).first()
+
+        if not row:
             raise ValueError("Conversation not found")
-        
-        message_count = self.db.query(Message).filter(
-            Message.conversation_id == conversation.id
-        ).count()
-        
+
+        conversation, message_count = row
+
         return {
             "session_id": session_id,
             "customer_email": conversation.customer_email,
@@ -195,4 +244,4 @@ class ChatService:
             "message_count": message_count,
             "created_at": conversation.created_at.isoformat(),
             "updated_at": conversation.updated_at.isoformat() if conversation.updated_at else None
-        }
\ No newline at end of file
+        }
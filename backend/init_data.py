@@ -1,7 +1,69 @@
 """Initialize database with sample data"""
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from app.db import SessionLocal
 from app.db.models import SystemPrompt, Customer, Organization, User, OrganizationPlan, OrganizationStatus, UserRole
 from datetime import datetime
+from typing import Final
+
+
+# Default prompt bodies as module constants: allocated once at import
+# instead of rebuilt inside every init_sample_data call
+GENERAL_SUPPORT_PROMPT: Final[str] = """You are a helpful customer support AI assistant. Your goal is to provide excellent customer service while being empathetic, professional, and efficient.
+Guidelines:
+- Always be polite and empathetic
+- Listen carefully to customer concerns
+- Provide clear, actionable solutions
+- If you can help with refunds, subscription changes, or account issues, use the appropriate tools
+- If the issue is complex or you're unsure, escalate to a human agent
+- Always confirm customer details before taking any actions
+- Be proactive in offering additional help
+
+Common tasks you can handle:
+- Process refunds for orders
+- Cancel or modify subscriptions
+- Answer product questions
+- Help with account issues
+- Provide billing information
+
+Remember: Customer satisfaction is our top priority."""
+
+BILLING_SUPPORT_PROMPT: Final[str] = """You are a specialized billing support AI assistant. You help customers with billing-related inquiries, refunds, and subscription management.
+
+Guidelines:
+- Always verify customer identity before discussing billing information
+- Be clear about refund policies and timelines
+- Explain billing cycles and charges clearly
+- Help customers understand their subscription benefits
+- Process refunds when appropriate using the refund tool
+- Handle subscription cancellations and modifications
+- Escalate complex billing disputes to human agents
+
+Refund Policy:
+- Refunds are available within 30 days of purchase
+- Subscription refunds are prorated
+- Processing time is 3-5 business days
+- Always provide refund confirmation numbers"""
+
+TECHNICAL_SUPPORT_PROMPT: Final[str] = """You are a technical support AI assistant. You help customers with technical issues, product setup, and troubleshooting.
+
+Guidelines:
+- Ask clarifying questions to understand the technical issue
+- Provide step-by-step troubleshooting instructions
+- Be patient with customers who may not be technically savvy
+- Offer multiple solutions when possible
+- Know when to escalate complex technical issues
+- Provide links to documentation when helpful
+- Follow up to ensure issues are resolved
+
+Common technical issues:
+- Login problems
+- Product setup and configuration
+- Integration issues
+- Performance problems
+- Feature questions
+
+If you cannot resolve a technical issue, escalate to our technical team immediately."""
 
 
 def init_sample_data():
@@ -47,24 +109,7 @@ def init_sample_data():
         default_prompts = [
             {
                 "name": "general_support",
-                "content": """You are a helpful customer support AI assistant. Your goal is to provide excellent customer service while being empathetic, professional, and efficient.
-Guidelines:
-- Always be polite and empathetic
-- Listen carefully to customer concerns
-- Provide clear, actionable solutions
-- If you can help with refunds, subscription changes, or account issues, use the appropriate tools
-- If the issue is complex or you're unsure, escalate to a human agent
-- Always confirm customer details before taking any actions
-- Be proactive in offering additional help
-
-Common tasks you can handle:
-- Process refunds for orders
-- Cancel or modify subscriptions
-- Answer product questions
-- Help with account issues
-- Provide billing information
-
-Remember: Customer satisfaction is our top priority.""",
+                "content": GENERAL_SUPPORT_PROMPT,
                 "description": "General customer support prompt for handling common inquiries",
                 "department": "general",
                 "organization_id": default_org.id if default_org else None,
@@ -72,48 +117,15 @@ Remember: Customer satisfaction is our top priority.""",
             },
             {
                 "name": "billing_support",
-                "content": """You are a specialized billing support AI assistant. You help customers with billing-related inquiries, refunds, and subscription management.
-
-Guidelines:
-- Always verify customer identity before discussing billing information
-- Be clear about refund policies and timelines
-- Explain billing cycles and charges clearly
-- Help customers understand their subscription benefits
-- Process refunds when appropriate using the refund tool
-- Handle subscription cancellations and modifications
-- Escalate complex billing disputes to human agents
-
-Refund Policy:
-- Refunds are available within 30 days of purchase
-- Subscription refunds are prorated
-- Processing time is 3-5 business days
-- Always provide refund confirmation numbers""",
-"description": "Specialized prompt for billing and refund inquiries",
+                "content": BILLING_SUPPORT_PROMPT,
+                "description": "Specialized prompt for billing and refund inquiries",
                 "department": "billing",
                 "organization_id": default_org.id if default_org else None,
                 "created_by_user_id": default_user.id if default_user else None
             },
             {
                 "name": "technical_support",
-                "content": """You are a technical support AI assistant. You help customers with technical issues, product setup, and troubleshooting.
-
-Guidelines:
-- Ask clarifying questions to understand the technical issue
-- Provide step-by-step troubleshooting instructions
-- Be patient with customers who may not be technically savvy
-- Offer multiple solutions when possible
-- Know when to escalate complex technical issues
-- Provide links to documentation when helpful
-- Follow up to ensure issues are resolved
-
-Common technical issues:
-- Login problems
-- Product setup and configuration
-- Integration issues
-- Performance problems
-- Feature questions
-
-If you cannot resolve a technical issue, escalate to our technical team immediately.""",
+                "content": TECHNICAL_SUPPORT_PROMPT,
                 "description": "Technical support prompt for product and technical issues",
                 "department": "technical",
                 "organization_id": default_org.id if default_org else None,
@@ -121,17 +133,18 @@ If you cannot resolve a technical issue, escalate to our technical team immediat
             }
         ]
 
-        for prompt_data in default_prompts:
-            existing = db.query(SystemPrompt).filter(
-                SystemPrompt.name == prompt_data["name"],
-                SystemPrompt.organization_id == prompt_data["organization_id"]
-            ).first()
+        # Race-safe idempotent seeding: one INSERT ... ON CONFLICT DO
+        # NOTHING per table instead of a probe SELECT plus inserts
+        insert_fn = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
 
-            if not existing:
-                prompt = SystemPrompt(**prompt_data)
-                db.add(prompt)
+        db.execute(
+            insert_fn(SystemPrompt)
+            .values(default_prompts)
+            .on_conflict_do_nothing(index_elements=["name"])
+        )
 
-        # Create sample customers
+        # Create sample customers. Multi-row .values() requires
+        # homogeneous dicts, so absent fields are spelled out as None
         sample_customers = [
             {
                 "email": "john.doe@example.com",
@@ -154,6 +167,7 @@ If you cannot resolve a technical issue, escalate to our technical team immediat
             {
                 "email": "bob.wilson@example.com",
                 "name": "Bob Wilson",
+                "phone": None,
                 "subscription_status": "cancelled",
                 "subscription_plan": "pro",
                 "total_spent": "599.98",
@@ -170,15 +184,11 @@ If you cannot resolve a technical issue, escalate to our technical team immediat
             }
         ]
 
-        for customer_data in sample_customers:
-            existing = db.query(Customer).filter(
-                Customer.email == customer_data["email"],
-                Customer.organization_id == customer_data["organization_id"]
-            ).first()
-
-            if not existing:
-                customer = Customer(**customer_data)
-                db.add(customer)
+        db.execute(
+            insert_fn(Customer)
+            .values(sample_customers)
+            .on_conflict_do_nothing(index_elements=["organization_id", "email"])
+        )
 
         db.commit()
         print("Sample data initialized successfully!")
@@ -1,24 +1,25 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from app.core.config import settings
 from app.api import api_router
-from app.db import Base, engine
+from app.api.deps import record_api_usage
+from app.db import init_db
 import logging
+import time
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Create tables
-Base.metadata.create_all(bind=engine)
-
 # Create FastAPI app
 app = FastAPI(
     title=settings.PROJECT_NAME,
     description="AI-powered customer support platform similar to Decagon AI",
     version="1.0.0",
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    default_response_class=ORJSONResponse
 )
 
 # Set up CORS
@@ -34,21 +35,69 @@ app.add_middleware(
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
 
+@app.middleware("http")
+async def track_api_usage(request: Request, call_next):
+    """Buffer a usage-log row for API-key authenticated requests.
+
+    The auth dependency stashes the key identity on request.state; by the
+    time the response exists here, the status code and latency are known,
+    and record_api_usage just appends to the in-process buffer."""
+    start = time.perf_counter()
+    response = await call_next(request)
+    api_key_id = getattr(request.state, "api_key_id", None)
+    if api_key_id is not None:
+        record_api_usage(
+            api_key_id=api_key_id,
+            organization_id=request.state.api_key_org_id,
+            endpoint=request.url.path,
+            method=request.method,
+            status_code=response.status_code,
+            response_time_ms=int((time.perf_counter() - start) * 1000)
+        )
+    return response
+
+
+@app.on_event("startup")
+async def create_tables():
+    """Create missing tables once the worker is up (dev convenience).
+
+    Kept off the import path so forked workers don't each replay the
+    schema reflection queries; create_all itself is checkfirst, so a
+    concurrent worker racing it is harmless."""
+    if settings.AUTO_CREATE_TABLES:
+        await init_db()
+
+
+@app.on_event("shutdown")
+async def flush_pending_writes():
+    """Flush buffered API-key timestamps and usage logs before exit"""
+    from app.api.deps import flush_api_key_last_used, flush_api_usage_logs
+    await flush_api_key_last_used()
+    await flush_api_usage_logs()
+
+
+# Both payloads are constant, so the responses are encoded once at import;
+# returning a Response directly also skips the serialization machinery on
+# every liveness probe
+_ROOT_RESPONSE = ORJSONResponse({
+    "message": "Customer Support AI Platform",
+    "version": "1.0.0",
+    "docs": "/docs",
+    "api": settings.API_V1_STR
+})
+_HEALTH_RESPONSE = ORJSONResponse({"status": "healthy", "service": "customer-support-ai"})
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
-    return {
-        "message": "Customer Support AI Platform",
-        "version": "1.0.0",
-        "docs": "/docs",
-        "api": settings.API_V1_STR
-    }
+    return _ROOT_RESPONSE
 
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "service": "customer-support-ai"}
+    return _HEALTH_RESPONSE
 
 
 if __name__ == "__main__":
@@ -27,7 +27,9 @@ from app.db.models import (
 
 def create_database_engine():
     """Create database engine"""
-    return create_engine(settings.DATABASE_URL, echo=True)
+    # echo=True logs every statement to stderr; on a large backfill the
+    # log I/O costs more than the updates themselves
+    return create_engine(settings.DATABASE_URL, echo=False)
 
 
 def create_default_organization(session):
@@ -106,58 +108,48 @@ def migrate_existing_data(session, organization, default_user):
         return
     
     print(f"Migrating {existing_conversations} existing conversations...")
-    
-    # Update existing conversations
-    session.execute(
-        text("UPDATE conversations SET organization_id = :org_id WHERE organization_id IS NULL"),
-        {"org_id": organization.id}
-    )
-    
-    # Update existing messages
-    session.execute(
-        text("UPDATE messages SET organization_id = :org_id WHERE organization_id IS NULL"),
-        {"org_id": organization.id}
-    )
-    
-    # Update existing system prompts
-    session.execute(
-        text("""
-            UPDATE system_prompts 
-            SET organization_id = :org_id, created_by_user_id = :user_id 
+
+    # All backfills run on one connection inside one transaction with a
+    # single commit (one WAL fsync) at the end. system_prompts also gets
+    # the default owner, so it carries an extra bind.
+    params = {"org_id": organization.id, "user_id": default_user.id}
+    backfills = [
+        "UPDATE conversations SET organization_id = :org_id WHERE organization_id IS NULL",
+        "UPDATE messages SET organization_id = :org_id WHERE organization_id IS NULL",
+        """
+            UPDATE system_prompts
+            SET organization_id = :org_id, created_by_user_id = :user_id
             WHERE organization_id IS NULL
-        """),
-        {"org_id": organization.id, "user_id": default_user.id}
-    )
-    
-    # Update existing customers
-    session.execute(
-        text("UPDATE customers SET organization_id = :org_id WHERE organization_id IS NULL"),
-        {"org_id": organization.id}
-    )
-    
-    # Update existing support actions
-    session.execute(
-        text("UPDATE support_actions SET organization_id = :org_id WHERE organization_id IS NULL"),
-        {"org_id": organization.id}
-    )
-    
+        """,
+        "UPDATE customers SET organization_id = :org_id WHERE organization_id IS NULL",
+        "UPDATE support_actions SET organization_id = :org_id WHERE organization_id IS NULL",
+    ]
+    for statement in backfills:
+        session.execute(text(statement), params)
+
     session.commit()
     print("Migration completed successfully!")
 
 
 def create_sample_api_key(session, organization, user):
     """Create a sample API key for testing"""
-    import hashlib
+    import base64
+    import hmac
     import secrets
     
-    # Generate a sample API key
-    api_key = f"sk_test_{secrets.token_urlsafe(32)}"
-    key_hash = hashlib.sha256(api_key.encode()).hexdigest()
-    
+    # Generate a sample API key (sk_<key_id>.<secret> format)
+    key_id = secrets.token_hex(8)
+    secret = base64.urlsafe_b64encode(secrets.token_bytes(32)).rstrip(b"=").decode("ascii")
+    api_key = f"sk_{key_id}.{secret}"
+    key_hash = hmac.new(
+        settings.SECRET_KEY.encode(), secret.encode(), "sha256"
+    ).digest()[:16]
+
     sample_api_key = APIKey(
         organization_id=organization.id,
         created_by_user_id=user.id,
         name="Default API Key",
+        key_id=key_id,
         key_hash=key_hash,
         key_prefix=api_key[:12],
         scopes=["read", "write"],